@@ -12,10 +12,14 @@ else:
 
 from pyperform.benchmark import Benchmark
 from .comparisonbenchmark import ComparisonBenchmark
+from .sweepbenchmark import SweepBenchmark
 from .benchmarkedclass import BenchmarkedClass
 from .benchmarkedfunction import BenchmarkedFunction
+from .parallel import run_parallel
+from .resultstore import ResultStore
 from .thread import Thread
-from .timer import timer
+from .timer import timer, LatencyTimer
+from .histogram import LatencyHistogram
 from .exceptions import ValidationError
 from .customlogger import CustomLogLevel, new_log_level
 
@@ -40,6 +44,31 @@ def disable():
     BenchmarkedClass.enable = False
 
 
+def defer(deferred=True):
+    """
+    Defer benchmarking. Decorated functions and classes are only recorded in the registry when they are defined and
+    are not run until pyperform.run() or pyperform.run_all() is called.
+    :param deferred: True to defer benchmarks, False to run them when they are defined.
+    """
+    Benchmark.deferred = deferred
+
+
+def run(group=None):
+    """
+    Run the deferred benchmarks in the registry.
+    :param group: name of the comparison group to run. If None, all benchmarks are run.
+    """
+    for benchmark in list(Benchmark.registry):
+        benchmark.run(group=group)
+
+
+def run_all():
+    """
+    Run all deferred benchmarks in the registry.
+    """
+    run()
+
+
 
 
 
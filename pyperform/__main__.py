@@ -0,0 +1,68 @@
+"""
+Command line runner of pyperform benchmark suites.
+
+    python -m pyperform [paths] [--list] [-k NAME] [-t TAG] [--skip-tag TAG] [--time-budget SECONDS]
+                        [--format {text,json,csv,html}] [-o OUTPUT]
+
+Benchmark modules are discovered in the given directories (the current directory by default) and imported with
+benchmarks deferred, then the selected groups are run one after another.
+"""
+from __future__ import print_function
+
+import argparse
+import logging
+import sys
+
+import pyperform
+from pyperform.reports import exporters
+from pyperform.runner import collect_units, discover_modules, list_units, load_module, run_units
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pyperform', description='Discover and run pyperform benchmarks.')
+    parser.add_argument('paths', nargs='*', default=['.'], help='directories to search and / or benchmark modules')
+    parser.add_argument('-p', '--pattern', action='append', dest='patterns',
+                        help='glob pattern of the file names of benchmark modules (default: bench*.py)')
+    parser.add_argument('-l', '--list', action='store_true', help='list the benchmark groups and exit')
+    parser.add_argument('-k', '--name', action='append', dest='names',
+                        help='run the groups whose name, or the name of one of their functions, matches this glob '
+                             'pattern or substring')
+    parser.add_argument('-t', '--tag', action='append', dest='tags', help='run the groups with this tag')
+    parser.add_argument('--skip-tag', action='append', dest='skip_tags', help='skip the groups with this tag')
+    parser.add_argument('--time-budget', type=float, help='total time in seconds. Groups are not started once it '
+                                                          'is spent')
+    parser.add_argument('-f', '--format', default='text', choices=['text'] + sorted(exporters),
+                        help='output format (default: text)')
+    parser.add_argument('-o', '--output', help='output file (default: standard out)')
+    parser.add_argument('--source', action='store_true', help='include the source code in text summaries')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log validation results')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='%(message)s')
+    pyperform.defer()
+
+    errors = 0
+    for path in discover_modules(args.paths, args.patterns or ('bench*.py',)):
+        try:
+            load_module(path)
+        except Exception as e:
+            logging.error('PyPerform: Could not import {}: {!r}'.format(path, e))
+            errors += 1
+
+    units = [u for u in collect_units() if u.matches(args.names, args.tags, args.skip_tags)]
+    if args.list:
+        list_units(units)
+        return 1 if errors else 0
+
+    failed, skipped = run_units(units, time_budget=args.time_budget, format=args.format, output=args.output,
+                                include_source=args.source)
+    if skipped:
+        print('Skipped {} group(s) after the time budget of {}s was spent: {}'
+              .format(len(skipped), args.time_budget, ', '.join(u.name for u in skipped)), file=sys.stderr)
+    if failed:
+        print('{} group(s) failed: {}'.format(len(failed), ', '.join(u.name for u in failed)), file=sys.stderr)
+    return 1 if errors or failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
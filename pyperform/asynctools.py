@@ -0,0 +1,44 @@
+__author__ = 'calvin'
+
+# Coroutine versions of the timing decorators. This module uses `async def` so it is only imported on Python 3.5+.
+
+import asyncio
+from functools import wraps
+from time import time
+
+from .timer import report_time
+from .tools import perf_counter_ns
+
+
+def async_timer(func):
+    """ Coroutine version of pyperform.timer. The time is measured until the coroutine has finished. """
+    async def _timed_function(*args, **kwargs):
+        t1 = time()
+        result = await func(*args, **kwargs)
+        t2 = time()
+        report_time(_timed_function, func, t2-t1)
+        return result
+
+    _timed_function._total_time = 0
+    _timed_function._call_count = 0
+    _timed_function.__name__ = "_timed_{}".format(func.__name__)
+
+    return _timed_function
+
+
+def async_latency_wrapper(func, record):
+    """ Coroutine version of the LatencyTimer wrapper. The latency is recorded when the coroutine has finished. """
+    @wraps(func)
+    async def _timed_function(*args, **kwargs):
+        t1 = perf_counter_ns()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            record(perf_counter_ns() - t1)
+
+    return _timed_function
+
+
+async def gather(coroutines):
+    """ Await coroutines concurrently. Used by the call statements of concurrent coroutine benchmarks. """
+    return await asyncio.gather(*coroutines)
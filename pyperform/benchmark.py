@@ -1,21 +1,97 @@
 __author__ = 'calvin'
 
+import gc
+import hashlib
 import inspect
+import logging
+import sys
 import timeit
+from array import array
 from types import FunctionType
 from pyperform import StringIO
 from .tools import *
+from . import stats
+from . import isolation
+from . import lineprofiler
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None  # Python 2.x
 
 
 class Benchmark(object):
     enable = True
+    deferred = False
+    registry = []
+    # Attributes that hold the measured results of a benchmark. These are sent back from worker processes when
+    # benchmarks are run in parallel.
+    result_attributes = ('time_average_seconds', 'timeit_repeat', 'timeit_number', 'relative_precision', 'trials',
+                         'time_min_seconds', 'time_median_seconds', 'time_iqr_seconds', 'time_stdev_seconds',
+                         'time_ci_seconds', 'memory_peak_bytes', 'memory_retained_bytes', 'memory_allocations', 'throughput',
+                         'settings', 'startup_seconds', 'setup_seconds', 'import_times', 'line_times')
+    # Confidence level and number of resamples of the bootstrap confidence interval of the median time.
+    confidence_level = 0.95
+    bootstrap_resamples = 1000
+    # Defaults used when calibrating the number of loops and trials automatically.
+    calibration_target_time = 0.2
+    calibration_precision = 0.01
+    calibration_time_budget = 10.
+    # At least 5 trials, so that ResultStore.compare() can detect a change at a significance level of 0.05
+    calibration_min_repeat = 5
+    # Number of calls that memory usage is measured over.
+    memory_iterations = 10
+    # Number of calls that the time of each line is measured over.
+    line_profile_iterations = 10
+    # Prefix of the names that arguments are given in the call statement in direct mode.
+    argument_prefix = '_pyperform'
+    # Defaults of the measurement settings, which can also be set per benchmark:
+    #   warmup_iterations: number of untimed loops run before the trials
+    #   gc_policy: 'disabled' (the timeit default), 'enabled', or 'collect' to disable the garbage collector while timing
+    #              and collect garbage before each trial
+    #   cpu_affinity: CPUs that the process is pinned to while the benchmark is run (None to leave it unchanged)
+    #   discard_outliers: discard trials outside of the Tukey fences with a factor of `outlier_factor`
+    warmup_iterations = 0
+    gc_policy = 'disabled'
+    gc_policies = ('disabled', 'enabled', 'collect')
+    cpu_affinity = None
+    discard_outliers = False
+    outlier_factor = 1.5
 
-    def __init__(self, setup=None, classname=None, timeit_repeat=3, timeit_number=1000, largs=None, kwargs=None):
+    def __init__(self, setup=None, classname=None, timeit_repeat=3, timeit_number=1000, largs=None, kwargs=None,
+                 calibrate=False, target_time=None, precision=None, time_budget=None, memory=False,
+                 concurrency=None, direct=False, warmup_iterations=None, gc_policy=None, cpu_affinity=None,
+                 discard_outliers=None, tags=None, isolated=False, line_profile=False):
+        if direct and sys.version_info < (3, 5):
+            raise ValueError('direct mode requires Python 3.5+')
+        if direct and isolated:
+            raise ValueError('direct mode can not be used with isolated benchmarks')
+        if gc_policy is not None and gc_policy not in self.gc_policies:
+            raise ValueError('gc_policy must be one of {}'.format(', '.join(self.gc_policies)))
         self.setup = setup
         self.timeit_repeat = timeit_repeat
         self.timeit_number = timeit_number
+        self.calibrate = calibrate
+        self.target_time = target_time if target_time is not None else self.calibration_target_time
+        self.precision = precision if precision is not None else self.calibration_precision
+        self.time_budget = time_budget if time_budget is not None else self.calibration_time_budget
+        self.relative_precision = None
+        if warmup_iterations is not None:
+            self.warmup_iterations = warmup_iterations
+        if gc_policy is not None:
+            self.gc_policy = gc_policy
+        if cpu_affinity is not None:
+            self.cpu_affinity = cpu_affinity
+        if discard_outliers is not None:
+            self.discard_outliers = discard_outliers
+        # Measurement settings in effect when the benchmark was run
+        self.settings = None
         self.classname = classname
         self.group = None
+        # Labels used to select benchmarks from the command line, for example 'slow'
+        if isinstance(tags, str):
+            tags = (tags,)
+        self.tags = frozenset(tags or ())
         self.is_class_method = None
         if largs is not None and type(largs) is tuple:
             self._args = largs[:]
@@ -23,23 +99,62 @@ class Benchmark(object):
             self._args = ()
         self._kwargs = kwargs.copy() if kwargs is not None else {}
         self.setup_src = ''
+        self.stmt = ''
+        # Statement that makes a single call, used to validate the result
+        self.validation_stmt = ''
+        # In direct mode, the objects that the call statement refers to by name
+        self.direct = direct
+        self.namespace = {}
         self.callable = None
         self._is_function = None
         self.log = StringIO.StringIO()
         self.time_average_seconds = None
+        # Time per call of each trial, in seconds
+        self.trials = array('d')
+        self.time_min_seconds = None
+        self.time_median_seconds = None
+        self.time_iqr_seconds = None
+        self.time_stdev_seconds = None
+        self.time_ci_seconds = None
+        self.memory = memory
+        self.memory_peak_bytes = None
+        self.memory_retained_bytes = None
+        self.memory_allocations = None
+        # Hits and time per call of each line of the function: [(line, source, hits, seconds), ...]
+        self.line_profile = line_profile
+        self.line_times = None
+        # Run each trial in a new interpreter and time the first call
+        self.isolated = isolated
+        self.startup_seconds = None
+        self.setup_seconds = None
+        # Median import times of the modules imported by the first call: [(module, level, self, cumulative), ...]
+        self.import_times = None
+        self.is_coroutine = None
+        self.concurrency = concurrency
+        # Calls per second when `concurrency` calls of a coroutine function are timed together
+        self.throughput = None
 
     def __call__(self, caller):
         if self.enable:
             self.callable = caller
             self._is_function = isinstance(caller, FunctionType)
 
-            fp = inspect.getfile(caller)
-            imports = get_tagged_imports(fp)
-            func_src = remove_decorators(globalize_indentation(inspect.getsource(caller)))
+            if self.direct:
+                # The real function is called, so its source is only needed for the log. Builtins and other callables
+                # without source code can be benchmarked.
+                try:
+                    func_src = remove_decorators(globalize_indentation(inspect.getsource(caller)))
+                except (TypeError, IOError):
+                    func_src = ''
+                imports = ''
+            else:
+                fp = inspect.getfile(caller)
+                imports = get_tagged_imports(fp)
+                func_src = remove_decorators(globalize_indentation(inspect.getsource(caller)))
 
             # Determine if the function is bound. If it is, keep track of it so we can run the benchmark after the class
             # benchmark has been initialized.
-            src_lines = func_src.splitlines()
+            src_lines = func_src.splitlines() or ['']
             self.is_class_method = 'def' in src_lines[0] and 'self' in src_lines[0]
             if self.is_class_method and self.classname:
                 from .benchmarkedclass import BenchmarkedClass
@@ -58,35 +173,308 @@ class Benchmark(object):
                 setup_src = ''
 
             src = '\n'.join([imports, setup_src, func_src])
-            self.setup_src = src + '\n'
-            self.log.write(self.setup_src)
+            if self.direct:
+                # Only the setup is run before timing, the statement calls the real function.
+                self.setup_src = setup_src + '\n'
+            else:
+                self.setup_src = src + '\n'
+            self.log.write(src + '\n')
 
-            self.stmt = generate_call_statement(caller, self.is_class_method, *self._args, **self._kwargs)
+            self.is_coroutine = iscoroutinefunction(caller)
+            if self.concurrency and not self.is_coroutine:
+                raise ValueError('concurrency can only be used to benchmark coroutine functions.')
+            self.stmt = self.call_statement(self._args, self._kwargs, self.concurrency)
+            self.validation_stmt = self.call_statement(self._args, self._kwargs)
 
         return caller
 
+    def call_statement(self, args, kwargs, concurrency=None):
+        """
+        Return the statement that calls the benchmarked function with the given arguments. Coroutine functions are run
+        to completion in an event loop. In direct mode, the function and arguments are added to the namespace of the
+        benchmark and the statement refers to them by name.
+        :param concurrency: number of concurrent calls of a coroutine function made by the statement (Optional)
+        """
+        if self.direct:
+            stmt, namespace = generate_direct_call_statement(self.callable, self.is_class_method, args, kwargs,
+                                                             self.argument_prefix)
+            self.namespace.update(namespace)
+        else:
+            stmt = generate_call_statement(self.callable, self.is_class_method, *args, **kwargs)
+        if self.is_coroutine:
+            stmt = generate_async_statement(stmt, concurrency)
+        return stmt
+
+    @property
+    def call_setup(self):
+        """ Setup code that the call statement needs in addition to the setup source, such as the event loop. """
+        return async_setup if self.is_coroutine else ''
+
+    @property
+    def loops(self):
+        """ Number of calls timed together in each trial. Isolated trials time a single call. """
+        return 1 if self.isolated else self.timeit_number
+
+    @property
+    def full_name(self):
+        """ Name of the benchmarked function, including the class name for bound methods. """
+        name = self.callable.__name__
+        return "{}.{}".format(self.classname, name) if self.classname else name
+
+    @property
+    def source_hash(self):
+        """ Hash of the benchmarked source code and call statement. """
+        return hashlib.sha1((self.log.getvalue() + self.stmt).encode('utf-8')).hexdigest()
+
+    def register(self):
+        """
+        Record the benchmark in the registry so that it can be run later with pyperform.run() or
+        pyperform.run_all().
+        """
+        if self not in Benchmark.registry:
+            Benchmark.registry.append(self)
+
+    def run(self, group=None):
+        """
+        Run the benchmark. Subclasses implement this.
+        :param group: only run the benchmark if it belongs to this group (Optional)
+        """
+        raise NotImplementedError
+
+    def members(self, group=None):
+        """
+        Return the benchmarks whose results are measured when this benchmark is run.
+        :param group: only return the benchmarks that belong to this group (Optional)
+        """
+        if group is not None and group != self.group:
+            return []
+        return [self]
+
+    def results(self):
+        """ Return the measured results of the benchmark as a dictionary. """
+        return {attr: getattr(self, attr) for attr in self.result_attributes}
+
+    def load_results(self, results):
+        """ Load measured results that were returned by Benchmark.results(). """
+        for attr, value in results.items():
+            setattr(self, attr, value)
+
     def write_log(self, fs=None):
         """
         Write the results of the benchmark to a log file.
         :param fs: file-like object.
         """
         log = StringIO.StringIO()
-        log.write(self.setup_src)
+        log.write(self.log.getvalue())
 
         # If the function is not bound, write the test score to the log
         if not self.is_class_method:
             time_avg = convert_time_units(self.time_average_seconds)
             log.write("\nAverage time: {0} \n".format(time_avg))
+            log.write("Median time: {0} \n".format(convert_time_units(self.time_median_seconds)))
+            if self.throughput is not None:
+                log.write("Throughput: {0:.1f} calls/s \n".format(self.throughput))
+        if self.line_times:
+            log.write("\nLine timings (per call):\n")
+            lineprofiler.write_line_times(self.line_times, log)
 
         if fs:
             with open(fs, 'w') as _f:
                 _f.write(log.getvalue())
 
-    def run_timeit(self, stmt, setup):
-        """ Create the function call statement as a string used for timeit. """
-        _timer = timeit.Timer(stmt=stmt, setup=setup)
-        trials = _timer.repeat(self.timeit_repeat, self.timeit_number)
-        self.time_average_seconds = sum(trials) / len(trials) / self.timeit_number
+    def run_timeit(self, stmt, setup, namespace=None):
+        """
+        Create the function call statement as a string used for timeit.
+        :param namespace: global namespace that the statement is run in, used in direct mode (Optional)
+        """
+        setup += self.call_setup
+        if self.gc_policy == 'enabled':
+            # timeit disables the garbage collector while timing, unless the setup enables it again
+            setup += '\nimport gc as _pyperform_gc\n_pyperform_gc.enable()\n'
+        if namespace:
+            _timer = timeit.Timer(stmt=stmt, setup=setup, globals=namespace)
+        else:
+            _timer = timeit.Timer(stmt=stmt, setup=setup)
+
+        previous_affinity = None
+        if self.cpu_affinity is not None:
+            previous_affinity = available_cpus()
+            if not set_cpu_affinity(self.cpu_affinity):
+                previous_affinity = None
+        try:
+            if self.isolated:
+                trials = self.run_isolated(stmt, setup)
+            else:
+                if self.warmup_iterations:
+                    _timer.timeit(self.warmup_iterations)
+                if self.calibrate:
+                    trials = self.run_calibrated(_timer)
+                else:
+                    trials = [self.time_trial(_timer, self.timeit_number) for _ in range(self.timeit_repeat)]
+            if self.memory:
+                self.run_memory(stmt, setup, namespace)
+            if self.line_profile:
+                self.run_line_profile(stmt, setup, namespace)
+        finally:
+            if previous_affinity is not None:
+                set_cpu_affinity(previous_affinity)
+
+        n_trials = len(trials)
+        if self.discard_outliers:
+            trials = stats.remove_outliers(trials, self.outlier_factor)
+        self.relative_precision = relative_standard_error(trials)
+        self.time_average_seconds = sum(trials) / len(trials) / self.loops
+        self.trials = array('d', (t / self.loops for t in trials))
+        self.compute_statistics()
+        self.settings = {'warmup_iterations': self.warmup_iterations,
+                         'gc_policy': self.gc_policy,
+                         'cpu_affinity': sorted(self.cpu_affinity) if previous_affinity is not None else None,
+                         'discard_outliers': self.discard_outliers,
+                         'trials_discarded': n_trials - len(trials),
+                         'calibrated': self.calibrate,
+                         'isolated': self.isolated}
         # Convert into reasonable time units
         time_avg = convert_time_units(self.time_average_seconds)
         return time_avg
+
+    def run_isolated(self, stmt, setup):
+        """
+        Run each of the `timeit_repeat` trials in a new interpreter and time the first, cold call of the statement, which
+        includes the imports that it makes. The median interpreter startup time, setup time and import times of the
+        modules imported by the call are also stored.
+        :return: list of trial times
+        """
+        trials = [isolation.run_trial(setup, stmt) for _ in range(self.timeit_repeat)]
+        self.startup_seconds = stats.median([t['startup_seconds'] for t in trials])
+        self.setup_seconds = stats.median([t['setup_seconds'] for t in trials])
+        self.import_times = isolation.median_imports(trials)
+        return [t['first_call_seconds'] for t in trials]
+
+    def time_trial(self, _timer, number):
+        """ Time a trial of `number` loops, collecting garbage first if the GC policy is 'collect'. """
+        if self.gc_policy == 'collect':
+            gc.collect()
+        return _timer.timeit(number)
+
+    def compute_statistics(self):
+        """ Compute robust statistics from the per-call times of the trials. """
+        trials = self.trials
+        self.time_min_seconds = min(trials)
+        self.time_median_seconds = stats.median(trials)
+        self.time_iqr_seconds = stats.iqr(trials)
+        self.time_stdev_seconds = stats.stdev(trials)
+        self.time_ci_seconds = stats.bootstrap_ci(trials, confidence=self.confidence_level,
+                                                  n_resamples=self.bootstrap_resamples)
+        if self.concurrency and self.time_median_seconds:
+            # Each timed call awaits `concurrency` calls of the coroutine
+            self.throughput = self.concurrency / self.time_median_seconds
+
+    def run_memory(self, stmt, setup, namespace=None):
+        """
+        Measure the memory used by the call statement with tracemalloc. The median over `memory_iterations` calls is
+        stored for:
+            memory_peak_bytes: peak memory traced during the call
+            memory_retained_bytes: memory that is still allocated after the call returns and its result is discarded
+            memory_allocations: number of memory blocks allocated by the call that are still alive when it returns
+                                (including the result). tracemalloc does not see blocks that are freed before then.
+        """
+        if tracemalloc is None:
+            logging.warning('PyPerform: Memory benchmarks require tracemalloc (Python 3.4+).')
+            return
+        if tracemalloc.is_tracing():
+            logging.warning('PyPerform: tracemalloc is already tracing. Existing traces will be cleared.')
+            started = False
+        else:
+            tracemalloc.start()
+            started = True
+
+        namespace = dict(namespace or {})
+        exec(setup, namespace)
+        code = compile(stmt, '<pyperform>', 'eval')
+        tracemalloc_filter = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        peaks, retained, allocations = [], [], []
+        try:
+            for _ in range(self.memory_iterations):
+                gc.collect()
+                # Only blocks allocated from here on are traced
+                tracemalloc.clear_traces()
+                result = eval(code, namespace)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                snapshot = tracemalloc.take_snapshot().filter_traces(tracemalloc_filter)
+                allocations.append(len(snapshot.traces))
+                del result, snapshot
+                gc.collect()
+                retained.append(tracemalloc.get_traced_memory()[0])
+        finally:
+            if started:
+                tracemalloc.stop()
+
+        self.memory_peak_bytes = stats.median(peaks)
+        self.memory_retained_bytes = stats.median(retained)
+        self.memory_allocations = stats.median(allocations)
+
+    def run_line_profile(self, stmt, setup, namespace=None):
+        """
+        Measure the hits and time of each line of the benchmarked function over `line_profile_iterations` calls, with
+        sys.monitoring on Python 3.12+ and sys.settrace() on older versions. Tracing slows every line down, so the
+        times are most useful relative to each other. The listing is stored in line_times.
+        """
+        namespace = dict(namespace or {})
+        if self.direct:
+            # The real function is called
+            exec(setup, namespace)
+            func = getattr(self.callable, '__func__', self.callable)
+            codes = [func.__code__] if hasattr(func, '__code__') else []
+        else:
+            # The function is defined by the setup source
+            setup_code = lineprofiler.register_source(setup)
+            exec(setup_code, namespace)
+            try:
+                def_line = [l for l in inspect.getsource(self.callable).splitlines()
+                            if l.lstrip().startswith(('def ', 'async def '))][0]
+            except (TypeError, IOError, IndexError):
+                def_line = None
+            codes = lineprofiler.find_code(setup_code, self.callable.__name__, def_line)
+        if not codes:
+            logging.warning('PyPerform: Could not find the code of {} to time its lines.'.format(self.full_name))
+            return
+
+        code = compile(stmt, '<pyperform>', 'exec')
+        with lineprofiler.LineTracer(codes) as tracer:
+            for _ in range(self.line_profile_iterations):
+                exec(code, namespace)
+        self.line_times = lineprofiler.line_times(tracer, codes, self.line_profile_iterations)
+
+    def run_calibrated(self, _timer):
+        """
+        Choose the number of loops and trials automatically. The number of loops is grown until a single trial takes at
+        least `target_time` seconds, then trials are repeated until the relative standard error of the trials is below
+        `precision` or `time_budget` seconds have elapsed. The chosen counts are stored in timeit_number and
+        timeit_repeat.
+        :param _timer: timeit.Timer
+        :return: list of trial times
+        """
+        t_start = timeit.default_timer()
+        number = 1
+        while True:
+            t = self.time_trial(_timer, number)
+            if t >= self.target_time or timeit.default_timer() - t_start >= self.time_budget:
+                break
+            # Estimate the number of loops needed to reach the target time, but grow by at most 10x per step.
+            if t > 0:
+                number = min(number * 10, max(number * 2, int(number * self.target_time / t) + 1))
+            else:
+                number *= 10
+
+        # The last calibration run was done with the final number of loops, so keep it as the first trial.
+        trials = [t]
+        while timeit.default_timer() - t_start < self.time_budget:
+            if len(trials) >= self.calibration_min_repeat:
+                error = relative_standard_error(trials)
+                if error is None or error <= self.precision:
+                    break
+            trials.append(self.time_trial(_timer, number))
+
+        self.timeit_number = number
+        self.timeit_repeat = len(trials)
+        return trials
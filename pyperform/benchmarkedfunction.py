@@ -1,6 +1,7 @@
 __author__ = 'calvin'
 
 from .benchmark import Benchmark
+from .lineprofiler import write_line_times
 from .tools import convert_time_units
 
 class BenchmarkedFunction(Benchmark):
@@ -9,6 +10,18 @@ class BenchmarkedFunction(Benchmark):
         if self.enable:
             super(BenchmarkedFunction, self).__call__(caller)
             if not self.is_class_method:
-                self.run_timeit(self.stmt, self.setup_src)
-                print("{} \t {}".format(caller.__name__, convert_time_units(self.time_average_seconds)))
+                if self.deferred:
+                    self.register()
+                else:
+                    self.run()
         return caller
+
+    def run(self, group=None):
+        if group is not None and group != self.group:
+            return
+        self.run_timeit(self.stmt, self.setup_src, self.namespace)
+        print("{} \t {}".format(self.callable.__name__, convert_time_units(self.time_average_seconds)))
+        if self.throughput is not None:
+            print("{} \t {:.1f} calls/s".format(self.callable.__name__, self.throughput))
+        if self.line_times:
+            write_line_times(self.line_times)
@@ -0,0 +1,170 @@
+__author__ = 'calvin'
+
+import hashlib
+import numbers
+import pickle
+from collections import Counter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _is_array(value):
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
+def equal(reference, result):
+    """
+    Exact comparison of two results, used when a ComparisonBenchmark has no validation function. Unlike ==, it can
+    compare NumPy arrays.
+    """
+    if _is_array(reference) or _is_array(result):
+        return bool(numpy.array_equal(reference, result))
+    return bool(reference == result)
+
+
+class Comparator(object):
+    """
+    Base class of the validation functions of ComparisonBenchmarks. A comparator is called with the reference result
+    of the group and the result of a benchmark and returns True if they are equivalent.
+
+    reduce() is applied to a result before it is compared. The reference result of a group is cached in its reduced
+    form, so a comparator can keep only what it needs of a large result (for example, its hash).
+    """
+
+    def __call__(self, reference, result):
+        return self.equal(self.reduce(reference), self.reduce(result))
+
+    def reduce(self, result):
+        return result
+
+    def equal(self, reference, result):
+        return equal(reference, result)
+
+
+class FloatComparator(Comparator):
+    """
+    Compares numbers within a tolerance, like math.isclose(). Lists, tuples and the values of dictionaries are compared
+    element by element, anything else is compared exactly.
+    :param rel_tol: maximum difference relative to the larger of the two numbers
+    :param abs_tol: maximum absolute difference
+    :param equal_nan: consider NaNs equal to each other
+    """
+
+    def __init__(self, rel_tol=1e-9, abs_tol=0., equal_nan=False):
+        self.rel_tol = rel_tol
+        self.abs_tol = abs_tol
+        self.equal_nan = equal_nan
+
+    def close(self, a, b):
+        if a == b:
+            return True
+        if a != a or b != b:
+            return self.equal_nan and a != a and b != b
+        return abs(a - b) <= max(self.rel_tol * max(abs(a), abs(b)), self.abs_tol)
+
+    def equal(self, reference, result):
+        if isinstance(reference, numbers.Number) and isinstance(result, numbers.Number):
+            return self.close(reference, result)
+        if isinstance(reference, dict) and isinstance(result, dict):
+            return (set(reference) == set(result) and
+                    all(self.equal(reference[k], result[k]) for k in reference))
+        if isinstance(reference, (list, tuple)) and isinstance(result, (list, tuple)):
+            return (len(reference) == len(result) and
+                    all(self.equal(a, b) for a, b in zip(reference, result)))
+        return equal(reference, result)
+
+
+class ArrayComparator(FloatComparator):
+    """
+    Compares arrays element-wise within a tolerance, like numpy.allclose(), but arrays of different shapes are never
+    equivalent. Without NumPy, lists and tuples of numbers are compared with the same tolerance.
+    :param rtol: maximum difference relative to the reference value
+    :param atol: maximum absolute difference
+    :param equal_nan: consider NaNs equal to each other
+    """
+
+    def __init__(self, rtol=1e-5, atol=1e-8, equal_nan=False):
+        super(ArrayComparator, self).__init__(equal_nan=equal_nan)
+        self.rtol = rtol
+        self.atol = atol
+
+    def close(self, a, b):
+        if a == b:
+            return True
+        if a != a or b != b:
+            return self.equal_nan and a != a and b != b
+        return abs(a - b) <= self.atol + self.rtol * abs(a)
+
+    def equal(self, reference, result):
+        if _is_array(reference) or _is_array(result):
+            reference, result = numpy.asarray(reference), numpy.asarray(result)
+            return (reference.shape == result.shape and
+                    bool(numpy.allclose(result, reference, rtol=self.rtol, atol=self.atol, equal_nan=self.equal_nan)))
+        return super(ArrayComparator, self).equal(reference, result)
+
+
+class UnorderedComparator(Comparator):
+    """
+    Compares containers regardless of the order of their elements, counting duplicates.
+    :param element_comparator: comparator used to match elements, for example a FloatComparator (Optional). By default,
+                               elements must be equal.
+    """
+
+    def __init__(self, element_comparator=None):
+        self.element_comparator = element_comparator
+
+    def equal(self, reference, result):
+        reference, result = list(reference), list(result)
+        if len(reference) != len(result):
+            return False
+        if self.element_comparator is None:
+            try:
+                return Counter(reference) == Counter(result)
+            except TypeError:
+                # Unhashable elements
+                pass
+            try:
+                return sorted(reference) == sorted(result)
+            except TypeError:
+                # Unorderable elements
+                pass
+        element_equal = self.element_comparator or equal
+        # Match each element of the result with an unmatched element of the reference
+        unmatched = reference
+        for value in result:
+            for i, candidate in enumerate(unmatched):
+                if element_equal(candidate, value):
+                    del unmatched[i]
+                    break
+            else:
+                return False
+        return True
+
+
+class HashComparator(Comparator):
+    """
+    Checks that results are exactly equal by comparing their hashes, so that only the hash of a large reference result
+    is kept in memory. Bytes and strings are hashed as they are, NumPy arrays by their dtype, shape and data and
+    anything else by its pickle, so equal objects that pickle differently (such as dictionaries with a different
+    insertion order) are not equivalent.
+    :param algorithm: name of a hashlib algorithm
+    """
+
+    def __init__(self, algorithm='sha1'):
+        self.algorithm = algorithm
+
+    def reduce(self, result):
+        h = hashlib.new(self.algorithm)
+        if isinstance(result, (bytes, bytearray)):
+            h.update(result)
+        elif isinstance(result, type(u'')):
+            h.update(result.encode('utf-8'))
+        elif _is_array(result):
+            h.update('{} {}'.format(result.dtype.str, result.shape).encode('utf-8'))
+            h.update(numpy.ascontiguousarray(result).tobytes())
+        else:
+            h.update(pickle.dumps(result, 2))
+        return h.hexdigest()
@@ -5,10 +5,14 @@ from pyperform import StringIO
 from .benchmark import Benchmark
 from .tools import *
 from .exceptions import ValidationError
+from .comparators import Comparator, equal
+from .lineprofiler import write_line_times
 
 
 class ComparisonBenchmark(Benchmark):
     groups = {}
+    # Reference result of each group, reduced by the group's Comparator if it has one
+    references = {}
 
     def __init__(self, group, classname=None, setup=None, validation=False, validation_func=None, largs=None, kwargs=None, **kw):
         super(ComparisonBenchmark, self).__init__(setup=setup, largs=largs, kwargs=kwargs, **kw)
@@ -24,82 +28,168 @@ class ComparisonBenchmark(Benchmark):
         if self.enable:
             super(ComparisonBenchmark, self).__call__(caller)
             self.groups[self.group].append(self)
-            # Bound functions are tested in ClassBenchmark.__call__
+            # Bound functions are tested in ClassBenchmark.run
             # Just store a reference to the ComparisonBenchmark if the function is bound, otherwise, run the test
+            # (or register it to be run later if benchmarks are deferred)
             if not self.is_class_method:
-                # Run the test
-                self.run_timeit(self.stmt, self.setup_src)
-                if self.result_validation:
-                    self.validate()
+                if self.deferred:
+                    self.register()
+                else:
+                    self.run()
         return caller
 
+    def run(self, group=None):
+        if group is not None and group != self.group:
+            return
+        self.run_timeit(self.stmt, self.setup_src, self.namespace)
+        if self.result_validation:
+            self.validate()
+
     def validate(self):
         """
         Execute the code once to get it's results (to be used in function validation). Compare the result to the
         first function in the group.
         """
-        validation_code = self.setup_src + '\nvalidation_result = ' + self.stmt
-        validation_scope = {}
+        validation_code = self.setup_src + self.call_setup + '\nvalidation_result = ' + self.validation_stmt
+        validation_scope = dict(self.namespace)
         exec(validation_code, validation_scope)
-        # Store the result in the first function in the group.
-        if len(self.groups[self.group]) == 1:
-            self.result = validation_scope['validation_result']
-            logging.info('PyPerform: Validating group "{b.group}" against function "{b.callable.__name__}"'
-                         .format(b=self))
+        self.check_result(validation_scope['validation_result'])
+
+    @property
+    def comparator(self):
+        """ Validation function of the group: the first one that was given to a benchmark in the group. """
+        for benchmark in self.groups[self.group]:
+            if benchmark.validation_func is not None:
+                return benchmark.validation_func
+        return None
+
+    def check_result(self, result):
+        """
+        Compare a result to the reference result of the group, which is the result of the first benchmark in the
+        group. The reference result is computed once and cached in ComparisonBenchmark.references.
+        :param result: result of a call of the benchmarked function
+        """
+        comparator = self.comparator
+        if isinstance(comparator, Comparator):
+            result = comparator.reduce(result)
+
+        reference_benchmark = self.groups[self.group][0]
+        if self is reference_benchmark:
+            # Store the result in the first function in the group.
+            self.result = self.references[self.group] = result
+            logging.info('PyPerform: Validating group "{}" against function "{}"'.format(self.group, self.full_name))
+            return
+
+        test = [benchmark.result_validation for benchmark in self.groups[self.group]]
+        if not all(test):
+            raise ValueError('All functions within a group must have the same validation flag.')
+        if self.group not in self.references:
+            raise ValidationError('The reference result of group "{}" has not been computed. Function {} must be '
+                                  'validated first.'.format(self.group, reference_benchmark.full_name))
+        compare_result = self.references[self.group]
+        if isinstance(comparator, Comparator):
+            results_are_valid = comparator.equal(compare_result, result)
+        elif comparator is not None:
+            results_are_valid = comparator(compare_result, result)
         else:
-            compare_against_benchmark = self.groups[self.group][0]
-            test = [benchmark.result_validation for benchmark in self.groups[self.group]]
-            if not all(test):
-                raise ValueError('All functions within a group must have the same validation flag.')
-            compare_result = compare_against_benchmark.result
-            if self.validation_func:
-                results_are_valid = self.validation_func(compare_result, validation_scope['validation_result'])
-            else:
-                results_are_valid = compare_result == validation_scope['validation_result']
-            if results_are_valid:
-                logging.info('PyPerform: Validating {}......PASSED!'.format(self.callable.__name__))
-            else:
-                error = 'Results of functions {0} and {1} are not equivalent.\n{0}:\t {2}\n{1}:\t{3}'
-                raise ValidationError(error.format(compare_against_benchmark.callable.__name__, self.callable.__name__,
-                                          compare_result, validation_scope['validation_result']))
+            results_are_valid = equal(compare_result, result)
+        if results_are_valid:
+            logging.info('PyPerform: Validating {}......PASSED!'.format(self.full_name))
+        else:
+            error = 'Results of functions {0} and {1} are not equivalent.\n{0}:\t {2}\n{1}:\t{3}'
+            raise ValidationError(error.format(reference_benchmark.full_name, self.full_name, compare_result, result))
 
     @staticmethod
-    def summarize(group, fs=None, include_source=True):
+    def summarize(group, fs=None, include_source=True, rank_by='time_median_seconds'):
         """
         Tabulate and write the results of ComparisonBenchmarks to a file or standard out.
         :param str group: name of the comparison group.
         :param fs: file-like object (Optional)
+        :param include_source: include the source code of the benchmarks in the summary.
+        :param rank_by: name of the result attribute that the benchmarks are ranked by. Benchmarks that do not have it
+                        (for example memory_peak_bytes of a benchmark run without memory=True) are ranked last.
         """
-        _line_break = '{0:-<120}\n'.format('')
-        tests = sorted(ComparisonBenchmark.groups[group], key=lambda t: getattr(t, 'time_average_seconds'))
+        # Benchmarks that have not been run yet (for example, deferred benchmarks) are left out
+        tests = sorted((t for t in ComparisonBenchmark.groups[group] if t.trials),
+                       key=lambda t: (getattr(t, rank_by) is None, getattr(t, rank_by)))
+        if not tests:
+            logging.info('PyPerform: No results to summarize in group "{}".'.format(group))
+            return
+        include_memory = any(t.memory_peak_bytes is not None for t in tests)
+        include_throughput = any(t.throughput is not None for t in tests)
+        include_startup = any(t.startup_seconds is not None for t in tests)
+        _line_break = '{0:-<{1}}\n'.format('', 160 + 36 * include_memory + 16 * include_throughput +
+                                           13 * include_startup)
         log = StringIO.StringIO()
         log.write('Call statement:\n\n')
         log.write('\t' + tests[0].stmt)
         log.write('\n\n\n')
-        fmt = "{0: <8} {1: <35} {2: <12} {3: <15} {4: <15} {5: <14}\n"
-        log.write(fmt.format('Rank', 'Function Name', 'Time', '% of Slowest', 'timeit_repeat', 'timeit_number'))
+        fmt = "{0: <6} {1: <35} {2: <12} {3: <12} {4: <12} {5: <12} {6: <26} {7: <13} {8: <14} {9: <14}"
+        ci_header = '{:.0f}% CI (median)'.format(100 * tests[0].confidence_level)
+        headers = ['Rank', 'Function Name', 'Median', 'Min', 'IQR', 'Std Dev', ci_header, '% of Slowest',
+                   'timeit_repeat', 'timeit_number']
+        if include_memory:
+            fmt += " {10: <12} {11: <12} {12: <8}"
+            headers += ['Peak Mem', 'Retained', 'Allocs']
+        if include_throughput:
+            fmt += " {%d: <15}" % len(headers)
+            headers += ['Throughput']
+        if include_startup:
+            fmt += " {%d: <12}" % len(headers)
+            headers += ['Startup']
+        fmt += "\n"
+        log.write(fmt.format(*headers))
         log.write(_line_break)
         log.write('\n')
 
+        ranked = [t for t in tests if getattr(t, rank_by) is not None]
+        slowest = getattr(ranked[-1], rank_by) if ranked else None
         for i, t in enumerate(tests):
-            func_name = "{}.{}".format(t.classname, t.callable.__name__) if t.classname else t.callable.__name__
-            if i == len(tests)-1:
+            if getattr(t, rank_by) is None:
+                time_percent = 'n/a'
+            elif i == len(ranked)-1:
                 time_percent = 'Slowest'
+            elif not slowest:
+                time_percent = 'n/a'
+            else:
+                time_percent = "{:.1f}".format(getattr(t, rank_by) / slowest * 100)
+            if t.time_ci_seconds is None:
+                ci = 'n/a'
             else:
-                time_percent = "{:.1f}".format(t.time_average_seconds / tests[-1].time_average_seconds * 100)
-            log.write(fmt.format(i+1,
-                                 func_name,
-                                 convert_time_units(t.time_average_seconds),
-                                 time_percent,
-                                 t.timeit_repeat,
-                                 t.timeit_number))
+                ci = '[{}, {}]'.format(*map(convert_time_units, t.time_ci_seconds))
+            row = [i+1,
+                   t.full_name,
+                   convert_time_units(t.time_median_seconds),
+                   convert_time_units(t.time_min_seconds),
+                   convert_time_units(t.time_iqr_seconds),
+                   'n/a' if t.time_stdev_seconds is None else convert_time_units(t.time_stdev_seconds),
+                   ci,
+                   time_percent,
+                   t.timeit_repeat,
+                   t.loops]
+            if include_memory:
+                if t.memory_peak_bytes is None:
+                    row += ['n/a', 'n/a', 'n/a']
+                else:
+                    row += [convert_memory_units(t.memory_peak_bytes), convert_memory_units(t.memory_retained_bytes),
+                            '{:.0f}'.format(t.memory_allocations)]
+            if include_throughput:
+                row.append('n/a' if t.throughput is None else '{:.1f}/s'.format(t.throughput))
+            if include_startup:
+                row.append('n/a' if t.startup_seconds is None else convert_time_units(t.startup_seconds))
+            log.write(fmt.format(*row))
         log.write(_line_break)
+        if len(ranked) < len(tests):
+            log.write('Benchmarks without {} are ranked last.\n'.format(rank_by))
 
         if include_source:
             log.write('\n\n\nSource Code:\n')
             log.write(_line_break)
             for test in tests:
                 log.write(test.log.getvalue())
+                if test.line_times:
+                    log.write('\nLine timings of {} (per call):\n'.format(test.full_name))
+                    write_line_times(test.line_times, log)
                 log.write(_line_break)
 
         if isinstance(fs, str):
@@ -0,0 +1,101 @@
+__author__ = 'calvin'
+
+from collections import OrderedDict, namedtuple
+from math import log
+
+# Growth functions of the complexity classes that timings are fitted to
+complexity_classes = OrderedDict([('O(1)', lambda n: 1.),
+                                  ('O(log n)', lambda n: log(n)),
+                                  ('O(n)', lambda n: float(n)),
+                                  ('O(n log n)', lambda n: n * log(n)),
+                                  ('O(n^2)', lambda n: float(n) ** 2),
+                                  ('O(n^3)', lambda n: float(n) ** 3)])
+# Complexity classes that are only defined for positive sizes
+logarithmic_classes = ('O(log n)', 'O(n log n)')
+
+
+class ComplexityFit(namedtuple('ComplexityFit', ('name', 'intercept', 'coefficient', 'residual'))):
+    """
+    The model time(n) = intercept + coefficient * f(n) of a complexity class. The residual is the root mean square of
+    the relative errors of the fit.
+    """
+
+    def __call__(self, n):
+        """ Return the predicted time for an input of size n. """
+        return self.intercept + self.coefficient * complexity_classes[self.name](n)
+
+
+def _fit(f, sizes, times):
+    """
+    Fit time = a + b * f(n) by least squares on the relative error, so that small and large sizes weigh the same.
+    :return: ComplexityFit or None if the fit has a negative coefficient.
+    """
+    # Weighted least squares with weights 1 / t^2
+    w = [1. / t ** 2 if t > 0 else 1. for t in times]
+    x = [f(n) for n in sizes]
+    sw = sum(w)
+    sx = sum(wi * xi for wi, xi in zip(w, x))
+    sy = sum(wi * yi for wi, yi in zip(w, times))
+    sxx = sum(wi * xi * xi for wi, xi in zip(w, x))
+    sxy = sum(wi * xi * yi for wi, xi, yi in zip(w, x, times))
+    denominator = sw * sxx - sx * sx
+    if abs(denominator) <= 1e-12 * sw * sxx:
+        # f is constant over the sizes: fit only the intercept.
+        a, b = sy / sw, 0.
+    else:
+        b = (sw * sxy - sx * sy) / denominator
+        a = (sy - b * sx) / sw
+    if b < 0:
+        return None
+    residual = (sum(wi * (yi - a - b * xi) ** 2 for wi, xi, yi in zip(w, x, times)) / len(times)) ** 0.5
+    return a, b, residual
+
+
+def fit_complexity(sizes, times, tolerance=0.05):
+    """
+    Fit timings to each of the complexity classes and return the one that fits best. A faster growing class always fits
+    noise at least as well as a slower growing one, so it is only chosen if it lowers the residual by more than
+    `tolerance`.
+    :param sizes: input sizes (at least 3). The logarithmic classes are only fitted if all sizes are positive.
+    :param times: time taken for each input size
+    :param tolerance: relative error that a faster growing class must improve the fit by to be chosen
+    :return: ComplexityFit, or None if there are not enough sizes to fit.
+    """
+    if len(sizes) < 3:
+        return None
+    fits = []
+    positive = all(n > 0 for n in sizes)
+    for name, f in complexity_classes.items():
+        if name in logarithmic_classes and not positive:
+            continue
+        if name == 'O(1)':
+            fit = _fit(lambda n: 0., sizes, times)
+        else:
+            fit = _fit(f, sizes, times)
+        if fit is not None:
+            fits.append(ComplexityFit(name, *fit))
+    best = fits[0]
+    for fit in fits[1:]:
+        if fit.residual < best.residual - tolerance:
+            best = fit
+    return best
+
+
+def crossovers(sweep_a, sweep_b):
+    """
+    Find the input sizes at which the faster of two functions changes.
+    :param sweep_a: list of (size, time) of the first function
+    :param sweep_b: list of (size, time) of the second function
+    :return: list of (size, faster) where size is interpolated between the measured sizes and faster is 0 if the first
+             function is faster above the crossover, or 1 if the second one is.
+    """
+    times_b = dict(sweep_b)
+    common = [(n, t, times_b[n]) for n, t in sorted(sweep_a) if n in times_b]
+    points = []
+    for (n0, a0, b0), (n1, a1, b1) in zip(common, common[1:]):
+        d0, d1 = a0 - b0, a1 - b1
+        if d0 == 0 or (d0 > 0) == (d1 > 0):
+            continue
+        n = n0 + (n1 - n0) * d0 / (d0 - d1)
+        points.append((n, 0 if d1 < 0 else 1))
+    return points
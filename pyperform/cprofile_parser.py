@@ -1,18 +1,21 @@
+from __future__ import print_function
+
 import marshal
-import os
+import sys
 
-from tools import convert_time_units
+from pyperform import StringIO
+from .tools import convert_time_units
 
 
 class cProfileFuncStat(object):
     """
     Class that represents a item in the pstats dictionary
     """
-    stats = {}
-    run_time_s = 0
+    __slots__ = ('filename', 'line_number', 'name', 'ncalls', 'nonrecursive_calls', 'own_time_s',
+                 'cummulative_time_s', 'callers', 'exclude', 'parser')
     n_decimal_percentages = 2
 
-    def __init__(self, filename, lineno, name, ncalls, ncall_nr, total_time, cum_time, subcall_stats=None):
+    def __init__(self, filename, lineno, name, ncalls, ncall_nr, total_time, cum_time, callers=None, parser=None):
         self.filename = filename
         self.line_number = lineno
         self.name = name
@@ -20,19 +23,15 @@ class cProfileFuncStat(object):
         self.nonrecursive_calls = ncall_nr
         self.own_time_s = total_time
         self.cummulative_time_s = cum_time
+        # Dictionary of {caller key: (ncalls, nonrecursive calls, own time, cummulative time)} as stored by pstats
+        self.callers = callers if callers is not None else {}
         self.exclude = False
-        self.parent = None
-
-        if (filename, lineno, name) not in cProfileFuncStat.stats:
-            cProfileFuncStat.stats[(filename, lineno, name)] = self
-            cProfileFuncStat.run_time_s += self.own_time_s
+        self.parser = parser
 
-        if subcall_stats:
-            self.subcall = cProfileFuncStat.from_dict(subcall_stats)
-            for s in self.subcall:
-                s.parent = self
-        else:
-            self.subcall = subcall_stats
+    @property
+    def key(self):
+        """ The (filename, line number, function name) key of the function in the pstats dictionary """
+        return self.filename, self.line_number, self.name
 
     @property
     def total_time(self):
@@ -44,11 +43,11 @@ class cProfileFuncStat(object):
 
     @property
     def percentage_cummulative(self):
-        return round(100 * self.cummulative_time_s / cProfileFuncStat.run_time_s, cProfileFuncStat.n_decimal_percentages)
+        return round(100 * self.cummulative_time_s / self.parser.run_time_s, self.n_decimal_percentages)
 
     @property
     def percentage_own(self):
-        return round(100 * self.own_time_s / cProfileFuncStat.run_time_s, cProfileFuncStat.n_decimal_percentages)
+        return round(100 * self.own_time_s / self.parser.run_time_s, self.n_decimal_percentages)
 
     @property
     def per_call_time(self):
@@ -59,34 +58,22 @@ class cProfileFuncStat(object):
         return self.own_time_s / self.nonrecursive_calls
 
     @classmethod
-    def from_dict(cls, d):
-        """Used to create an instance of this class from a pstats dict item"""
+    def from_dict(cls, d, parser=None):
+        """Used to create instances of this class from a pstats dictionary"""
         stats = []
-        for (filename, lineno, name), stat_values in d.iteritems():
+        for (filename, lineno, name), stat_values in d.items():
             if len(stat_values) == 5:
-                ncalls, ncall_nr, total_time, cum_time, subcall_stats = stat_values
+                ncalls, ncall_nr, total_time, cum_time, callers = stat_values
             else:
                 ncalls, ncall_nr, total_time, cum_time = stat_values
-                subcall_stats = None
-            stat = cProfileFuncStat(filename, lineno, name, ncalls, ncall_nr, total_time, cum_time, subcall_stats)
-            stats.append(stat)
-
+                callers = None
+            stats.append(cls(filename, lineno, name, ncalls, ncall_nr, total_time, cum_time, callers, parser))
         return stats
 
     def to_dict(self):
         """Convert back to the pstats dictionary representation (used for saving back as pstats binary file)"""
-        if self.subcall is not None:
-            if isinstance(self.subcall, dict):
-                subcalls = self.subcall
-            else:
-                subcalls = {}
-                for s in self.subcall:
-                    subcalls.update(s.to_dict())
-            return {(self.filename, self.line_number, self.name): \
-                        (self.ncalls, self.nonrecursive_calls, self.own_time_s, self.cummulative_time_s, subcalls)}
-        else:
-            return {(self.filename, self.line_number, self.name): \
-                        (self.ncalls, self.nonrecursive_calls, self.own_time_s, self.cummulative_time_s)}
+        return {self.key: (self.ncalls, self.nonrecursive_calls, self.own_time_s, self.cummulative_time_s,
+                           self.callers)}
 
     def __repr__(self):
         return "{s.name}: total={s.total_time}, cum={s.cummulative_time}" \
@@ -96,17 +83,52 @@ class cProfileFuncStat(object):
 class cProfileParser(object):
     """
     A manager class that reads in a pstats file and allows futher decontruction of the statistics.
+
+    The file is read once and indexed by function key, function name, file name and by caller / callee, so that
+    queries do not need to scan every function in the profile. All state is kept in the parser instance.
     """
     def __init__(self, pstats_file):
         self.path = pstats_file
 
-        with open(stat_file, 'rb') as _f:
-            self.raw_stats = _f.read()
-
-        with open(stat_file, 'r') as _f:
+        with open(pstats_file, 'rb') as _f:
             self.stats_dict = marshal.load(_f)
 
-        self.stats = cProfileFuncStat.from_dict(self.stats_dict)
+        self.stats = cProfileFuncStat.from_dict(self.stats_dict, parser=self)
+        self.run_time_s = sum(s.own_time_s for s in self.stats)
+        # Lists of the stats sorted by an attribute (descending), built on first use
+        self._sorted = {}
+
+        self.by_key = {}
+        self.by_name = {}
+        self.by_file = {}
+        self.callees = {}
+        for s in self.stats:
+            self.by_key[s.key] = s
+            self.by_name.setdefault(s.name, []).append(s)
+            self.by_file.setdefault(s.filename, []).append(s)
+            for caller_key, edge in s.callers.items():
+                self.callees.setdefault(caller_key, {})[s.key] = edge
+
+    def get(self, key):
+        """ Return the stat of a function from its (filename, line number, function name) key. """
+        return self.by_key.get(key)
+
+    def find(self, name=None, filename=None):
+        """ Return the stats of the functions with the given name and / or in the given file. """
+        if name is not None:
+            stats = self.by_name.get(name, [])
+            return [s for s in stats if filename is None or s.filename == filename]
+        if filename is not None:
+            return list(self.by_file.get(filename, []))
+        return list(self.stats)
+
+    def get_callers(self, stat):
+        """ Return a dictionary of {caller stat: (ncalls, nonrecursive calls, own time, cummulative time)}. """
+        return {self.by_key[k]: edge for k, edge in stat.callers.items() if k in self.by_key}
+
+    def get_callees(self, stat):
+        """ Return a dictionary of {callee stat: (ncalls, nonrecursive calls, own time, cummulative time)}. """
+        return {self.by_key[k]: edge for k, edge in self.callees.get(stat.key, {}).items() if k in self.by_key}
 
     def exclude_functions(self, *funcs):
         """
@@ -114,12 +136,21 @@ class cProfileParser(object):
         """
         for f in funcs:
             f.exclude = True
-        run_time_s = sum(0 if s.exclude else s.own_time_s for s in self.stats)
-        cProfileFuncStat.run_time_s = run_time_s
+        self.run_time_s = sum(0 if s.exclude else s.own_time_s for s in self.stats)
 
     def get_top(self, stat, n):
         """Return the top n values when sorting by 'stat'"""
-        return sorted(self.stats, key=lambda x: getattr(x, stat), reverse=True)[:n]
+        if stat not in self._sorted:
+            self._sorted[stat] = sorted(self.stats, key=lambda x: getattr(x, stat), reverse=True)
+        return self._sorted[stat][:n]
+
+    def compare(self, candidate):
+        """
+        Compare this profile (the baseline) against a candidate profile.
+        :param candidate: cProfileParser or path to a pstats file
+        :return: cProfileDiff
+        """
+        return cProfileDiff(self, candidate)
 
     def save_pstat(self, path):
         """
@@ -134,14 +165,148 @@ class cProfileParser(object):
             marshal.dump(stats, f)
 
 
-if __name__ == '__main__':
+class cProfileFuncDelta(object):
+    """
+    The change in the statistics of a function between a baseline and a candidate profile. Time deltas are also given
+    as a percentage of the baseline's total run time, and as the change of the function's share of the total run time
+    (in percentage points), which is meaningful when the two profiles ran for different lengths of time.
+    """
+    __slots__ = ('key', 'baseline', 'candidate', 'own_time_delta_s', 'cummulative_time_delta_s', 'ncalls_delta',
+                 'own_time_delta_pct', 'cummulative_time_delta_pct', 'own_share_delta_pct')
+
+    def __init__(self, key, baseline, candidate, baseline_run_time_s, candidate_run_time_s):
+        self.key = key
+        self.baseline = baseline
+        self.candidate = candidate
+        b_own, b_cum, b_calls = (baseline.own_time_s, baseline.cummulative_time_s, baseline.ncalls) if baseline \
+            else (0., 0., 0)
+        c_own, c_cum, c_calls = (candidate.own_time_s, candidate.cummulative_time_s, candidate.ncalls) if candidate \
+            else (0., 0., 0)
+        self.own_time_delta_s = c_own - b_own
+        self.cummulative_time_delta_s = c_cum - b_cum
+        self.ncalls_delta = c_calls - b_calls
+        self.own_time_delta_pct = 100 * self.own_time_delta_s / baseline_run_time_s if baseline_run_time_s else 0.
+        self.cummulative_time_delta_pct = 100 * self.cummulative_time_delta_s / baseline_run_time_s \
+            if baseline_run_time_s else 0.
+        b_share = b_own / baseline_run_time_s if baseline_run_time_s else 0.
+        c_share = c_own / candidate_run_time_s if candidate_run_time_s else 0.
+        self.own_share_delta_pct = 100 * (c_share - b_share)
+
+    @property
+    def name(self):
+        return self.key[2]
+
+    def __repr__(self):
+        return "{s.name}: own={own:+.3f} ms, cum={cum:+.3f} ms, N={s.ncalls_delta:+d}".format(
+            s=self, own=1000 * self.own_time_delta_s, cum=1000 * self.cummulative_time_delta_s)
+
+
+class cProfileDiff(object):
+    """
+    Differential comparison of a baseline and a candidate profile. Computes the per-function deltas of own time,
+    cummulative time and call counts, and the call paths whose time grew the most.
+    """
+
+    def __init__(self, baseline, candidate):
+        self.baseline = baseline if isinstance(baseline, cProfileParser) else cProfileParser(baseline)
+        self.candidate = candidate if isinstance(candidate, cProfileParser) else cProfileParser(candidate)
+        self.run_time_delta_s = self.candidate.run_time_s - self.baseline.run_time_s
+        self.deltas = {}
+        for key in set(self.baseline.by_key) | set(self.candidate.by_key):
+            self.deltas[key] = cProfileFuncDelta(key, self.baseline.by_key.get(key), self.candidate.by_key.get(key),
+                                                 self.baseline.run_time_s, self.candidate.run_time_s)
+
+    def get_top(self, stat='own_time_delta_s', n=20):
+        """ Return the n functions with the largest increase of 'stat' """
+        return sorted(self.deltas.values(), key=lambda d: getattr(d, stat), reverse=True)[:n]
 
-    stat_folder = "/home/local/SENSOFT/clobo/.PyCharm2016.1/system/snapshots"
-    stat_file = os.path.join(stat_folder, 'lmx64.pstat')
-    stat_file_out = os.path.join(stat_folder, 'lmx64-modified.pstat')
+    def _edge_growth(self, caller_key, callee_key):
+        """ Return the growth of the cummulative time spent in callee when called from caller. """
+        growth = 0.
+        for parser, sign in ((self.candidate, 1), (self.baseline, -1)):
+            callee = parser.by_key.get(callee_key)
+            if callee is not None and caller_key in callee.callers:
+                growth += sign * callee.callers[caller_key][3]
+        return growth
+
+    def grown_call_paths(self, n=5, max_depth=50):
+        """
+        Find the call paths leading to the functions whose own time grew the most. Starting from each function, the
+        caller whose call edge grew the most is followed up the call graph. Paths that are the beginning of another
+        reported path are left out.
+        :return: list of (growth of the cummulative time of the function in seconds,
+                          [function keys from the outermost caller to the function])
+        """
+        paths = []
+        for delta in self.get_top('own_time_delta_s', n):
+            if delta.own_time_delta_s <= 0:
+                break
+            path = [delta.key]
+            while len(path) < max_depth:
+                callers = set()
+                for parser in (self.candidate, self.baseline):
+                    stat = parser.by_key.get(path[0])
+                    if stat is not None:
+                        callers.update(stat.callers)
+                growth, caller = max([(self._edge_growth(c, path[0]), c) for c in callers if c not in path] or
+                                     [(0, None)])
+                if caller is None or growth <= 0:
+                    break
+                path.insert(0, caller)
+            paths.append((delta.cummulative_time_delta_s, path))
+        return [(growth, path) for growth, path in paths
+                if not any(len(other) > len(path) and other[:len(path)] == path for _, other in paths)]
+
+    def summarize(self, fs=None, n=20):
+        """
+        Write a report of the functions behind the change in run time, ranked by the growth of their own time.
+        :param fs: file-like object or path (Optional)
+        :param n: number of functions and call paths to report
+        """
+        _line_break = '{0:-<140}\n'.format('')
+        log = StringIO.StringIO()
+        log.write('Baseline: {} ({})\n'.format(self.baseline.path, convert_time_units(self.baseline.run_time_s)))
+        log.write('Candidate: {} ({})\n'.format(self.candidate.path, convert_time_units(self.candidate.run_time_s)))
+        log.write('Change: {:+.3f} s ({:+.1f}%)\n\n'.format(
+            self.run_time_delta_s,
+            100 * self.run_time_delta_s / self.baseline.run_time_s if self.baseline.run_time_s else 0.))
+
+        fmt = "{0: <6} {1: <45} {2: <14} {3: <10} {4: <14} {5: <10} {6: <12} {7: <12}\n"
+        log.write(fmt.format('Rank', 'Function Name', 'Own Delta', '% of Run', 'Cum Delta', '% of Run', 'Share Delta',
+                             'Calls Delta'))
+        log.write(_line_break)
+        for i, d in enumerate(self.get_top('own_time_delta_s', n)):
+            log.write(fmt.format(i + 1, '{}:{}({})'.format(*d.key)[-45:],
+                                 '{:+.3f} ms'.format(1000 * d.own_time_delta_s),
+                                 '{:+.2f}'.format(d.own_time_delta_pct),
+                                 '{:+.3f} ms'.format(1000 * d.cummulative_time_delta_s),
+                                 '{:+.2f}'.format(d.cummulative_time_delta_pct),
+                                 '{:+.2f}'.format(d.own_share_delta_pct),
+                                 '{:+d}'.format(d.ncalls_delta)))
+        log.write(_line_break)
+
+        log.write('\nCall paths that grew:\n\n')
+        for growth, path in self.grown_call_paths(n):
+            log.write('{:+.3f} ms\t{}\n'.format(1000 * growth, ' -> '.join(key[2] for key in path)))
+
+        if isinstance(fs, str):
+            with open(fs, 'w') as f:
+                f.write(log.getvalue())
+
+        elif fs is None:
+            print(log.getvalue())
+        else:
+            try:
+                fs.write(log.getvalue())
+            except AttributeError as e:
+                print(e)
+
+
+if __name__ == '__main__':
 
-    parser = cProfileParser(stat_file)
-    top_5 = parser.get_top('own_time_s', 5)
-    parser.exclude_functions(*top_5)
-    asd = parser.save_pstat(stat_file_out)
-    dfg=3
+    if len(sys.argv) > 2:
+        cProfileDiff(sys.argv[1], sys.argv[2]).summarize()
+    else:
+        parser = cProfileParser(sys.argv[1])
+        for s in parser.get_top('own_time_s', 20):
+            print(s)
@@ -1,4 +1,6 @@
-from functools import partial
+from functools import wraps
+from types import MethodType
+from weakref import WeakKeyDictionary
 
 
 class Halt(Exception):
@@ -15,97 +17,109 @@ class Encapsulate(object):
 
     Usage:
 
-        def pre_myfunc():
-            print 'Pre Main func'
+        class MyClass(object):
 
-        @Encapsulate
-        def myfunc():
-            print 'Main func'
+            def pre_myfunc(self):
+                print('Pre Main func')
 
-        def post_myfunc():
-            print 'Pre Main func'
+            @Encapsulate
+            def myfunc(self):
+                print('Main func')
 
+            def post_myfunc(self):
+                print('Post Main func')
 
-     myfunc()
+
+     MyClass().myfunc()
 
      >> 'Pre Main func'
      >> 'Main func'
      >> 'Post Main func'
 
+    The pre_ and post_ functions and whether the method is overridden are looked up once per class, when the method is
+    first accessed on an instance of that class, and cached for as long as the class exists. Instances are not
+    referenced, each access returns a plain bound method.
     """
-    encapsulations = {}
     halt = Halt
 
     def __init__(self, func):
         self._func = func
-        self._wrapper = None
-        self.overridden = False
-        self.objclass = None
-        self.instancemethods = {}
+        # Function that an instance of each class is bound to
+        self._resolved = WeakKeyDictionary()
 
     @property
     def func_name(self):
-        return self._func.func_name
+        return self._func.__name__
 
     def __call__(self, instance, *args, **kwargs):
-        if self.overridden:
-            # This Encapsulation is overridden so this call is from a super(). Do not execute PRE and POST twice
-            return self._func(instance, *args, **kwargs)
-
-        pre_func = getattr(instance, 'pre_%s' % self._func.func_name, None)
-        post_func = getattr(instance, 'post_%s' % self._func.func_name, None)
+        return self.resolve(type(instance))(instance, *args, **kwargs)
 
+    def __get__(self, obj, objtype=None):
+        """Support instance methods."""
+        if obj is None:
+            return self
+        return MethodType(self.resolve(type(obj)), obj)
+
+    def resolve(self, cls):
+        """
+        Return the function that is called when the method is called on an instance of `cls`, with the pre_ and post_
+        functions of the class built in.
+        """
         try:
+            return self._resolved[cls]
+        except KeyError:
+            pass
+        name = self.func_name
+        definitions = [c.__dict__[name] for c in cls.__mro__ if name in c.__dict__]
+        if definitions and definitions[0] is not self and any(d is self for d in definitions):
+            # This Encapsulation is overridden so this call is from a super(). Do not execute PRE and POST twice
+            func = self._func
+        else:
+            func = self._encapsulate(cls, _lookup(cls, 'pre_' + name), _lookup(cls, 'post_' + name))
+        self._resolved[cls] = func
+        return func
 
-            if pre_func is not None:
-                pre_func(*args, **kwargs)
-
-            ret = self._func(instance, *args, **kwargs)
-
-            if post_func is not None:
-                post_ret = post_func(*args, **kwargs)
-
-        except Halt as e:
-            return e.return_args
-
-        # return the post function value if it returns something other than None, otherwise return the
-        # main functions value
-        return post_ret or ret
+    def _encapsulate(self, cls, pre_func, post_func):
+        _func = self._func
+        if pre_func is None and post_func is None:
+            return _func
 
-    def __get__(self, obj, objtype):
-        """Support instance methods."""
-        if obj not in self.instancemethods:
+        @wraps(_func)
+        def encapsulated(instance, *args, **kwargs):
+            try:
+                if pre_func is not None:
+                    pre_func(instance, cls)(*args, **kwargs)
 
-            self.objclass = obj.__class__
-            if obj not in Encapsulate.encapsulations:
-                Encapsulate.encapsulations[obj] = {self.func_name: []}
+                ret = _func(instance, *args, **kwargs)
 
-            Encapsulate.encapsulations[obj][self.func_name].append(self)
+                post_ret = None
+                if post_func is not None:
+                    post_ret = post_func(instance, cls)(*args, **kwargs)
 
-            # Go through Encapsulations on this objects function and determine which one
-            # is overridden. We need to know this so that when the overridden function is called
-            # the pre and post functions aren't called again.
-            for enc in Encapsulate.encapsulations[obj][self.func_name]:
-                # Determine the call order of the functions
-                call_order = []
-                for ii, cls in enumerate(objtype.__mro__):
-                    func = cls.__dict__.get(self.func_name, None)
-                    if isinstance(func, Encapsulate):
-                        func = func._func
+            except Halt as e:
+                return e.return_args
 
-                    call_order.append(func)
+            # return the post function value if it returns something other than None, otherwise return the
+            # main functions value
+            return ret if post_ret is None else post_ret
 
-                try:
-                    idx = call_order.index(enc._func)
-                except ValueError:
-                    pass
-                else:
-                    if idx > 0 and any(call_order[:idx]):
-                        enc.overridden = True
+        return encapsulated
 
-            self.instancemethods[obj] = partial(self.__call__, obj)
+    def __repr__(self):
+        return 'Encapsulation for %s' % self._func.__name__
 
-        return self.instancemethods[obj]
 
-    def __repr__(self):
-        return 'Encapsulation for %s' % self._func.func_name
\ No newline at end of file
+def _lookup(cls, name):
+    """
+    Find an attribute in the class hierarchy and return a function of (instance, class) that returns it as it would be
+    returned by getattr(instance, name), or None if the class does not have the attribute.
+    """
+    for c in cls.__mro__:
+        if name in c.__dict__:
+            attr = c.__dict__[name]
+            break
+    else:
+        return None
+    if hasattr(type(attr), '__get__'):
+        return attr.__get__
+    return lambda instance, owner: attr
@@ -0,0 +1,155 @@
+__author__ = 'calvin'
+
+import os
+import zlib
+from xml.sax.saxutils import escape
+
+from .cprofile_parser import cProfileParser
+
+
+def _frame_label(stat):
+    """ Label of a stack frame in the collapsed-stack format. Semicolons separate frames so they are replaced. """
+    if stat.filename == '~':
+        label = stat.name
+    else:
+        label = '{} ({}:{})'.format(stat.name, os.path.basename(stat.filename), stat.line_number)
+    return label.replace(';', ':')
+
+
+def collapsed_stacks(parser, max_depth=64, min_fraction=1e-4):
+    """
+    Rebuild approximate call stacks from the caller / callee edges of a profile. pstats only records the time spent
+    in a function per direct caller, so the time of a function is split between the stacks it appears in in
+    proportion to the time each of its callers spent calling it.
+    :param parser: cProfileParser or path to a pstats file
+    :param max_depth: maximum depth of the stacks
+    :param min_fraction: stacks that take less than this fraction of the total run time are pruned
+    :return: dictionary of {tuple of frame labels: own time in seconds}
+    """
+    if not isinstance(parser, cProfileParser):
+        parser = cProfileParser(parser)
+    min_time = parser.run_time_s * min_fraction
+    stacks = {}
+
+    def expand(stat, path, keys, weight):
+        path = path + (_frame_label(stat),)
+        keys = keys + (stat.key,)
+        cum = stat.cummulative_time_s
+        own = weight * stat.own_time_s / cum if cum > 0 else weight
+        if own > 0:
+            stacks[path] = stacks.get(path, 0.) + own
+        if len(path) >= max_depth or cum <= 0:
+            return
+        for callee, edge in parser.get_callees(stat).items():
+            # Skip recursive calls, their time is already part of the caller's cummulative time.
+            if callee.key in keys:
+                continue
+            child_weight = weight * edge[3] / cum
+            if child_weight >= min_time:
+                expand(callee, path, keys, child_weight)
+
+    for stat in parser.stats:
+        if not any(k in parser.by_key for k in stat.callers):
+            expand(stat, (), (), stat.cummulative_time_s)
+    return stacks
+
+
+def write_collapsed(stacks, fs):
+    """
+    Write stacks in the collapsed-stack format used by flamegraph tools: one "frame;frame;frame value" line per stack,
+    with values in integer microseconds.
+    :param stacks: dictionary returned by collapsed_stacks()
+    :param fs: path or file-like object
+    """
+    if isinstance(fs, str):
+        with open(fs, 'w') as f:
+            return write_collapsed(stacks, f)
+    for path, seconds in sorted(stacks.items()):
+        value = int(round(seconds * 1e6))
+        if value > 0:
+            fs.write('{} {}\n'.format(';'.join(path), value))
+
+
+def _build_tree(stacks):
+    root = {'name': 'all', 'value': 0., 'children': {}}
+    for path, seconds in stacks.items():
+        root['value'] += seconds
+        node = root
+        for frame in path:
+            node = node['children'].setdefault(frame, {'name': frame, 'value': 0., 'children': {}})
+            node['value'] += seconds
+    return root
+
+
+def _color(name):
+    """ A warm color that is stable for each frame name. """
+    h = zlib.crc32(name.encode('utf-8')) & 0xffffffff
+    return 'rgb({},{},{})'.format(205 + h % 50, 80 + (h >> 8) % 150, (h >> 16) % 55)
+
+
+def write_svg(stacks, fs, title='Flame Graph', width=1200, frame_height=16, font_size=11):
+    """
+    Write a self-contained SVG flame graph. Hovering over a frame shows its name and time.
+    :param stacks: dictionary returned by collapsed_stacks()
+    :param fs: path or file-like object
+    """
+    if isinstance(fs, str):
+        with open(fs, 'w') as f:
+            return write_svg(stacks, f, title=title, width=width, frame_height=frame_height, font_size=font_size)
+
+    root = _build_tree(stacks)
+    total = root['value'] or 1.
+
+    def depth(node):
+        return 1 + max([depth(c) for c in node['children'].values()] or [0])
+
+    top_margin = 2 * frame_height + 10
+    height = top_margin + depth(root) * frame_height + 10
+    fs.write('<?xml version="1.0" standalone="no"?>\n')
+    fs.write('<svg version="1.1" width="{w}" height="{h}" viewBox="0 0 {w} {h}" xmlns="http://www.w3.org/2000/svg">\n'
+             .format(w=width, h=height))
+    fs.write('<rect x="0" y="0" width="{}" height="{}" fill="#f8f8f8"/>\n'.format(width, height))
+    fs.write('<text x="{}" y="{}" font-size="{}" font-family="Verdana" text-anchor="middle">{}</text>\n'
+             .format(width / 2., frame_height + 4, font_size + 5, escape(title)))
+    char_width = font_size * 0.6
+
+    # Frames are drawn bottom-up with the root at the bottom
+    stack = [(root, 10., 0)]
+    scale = (width - 20.) / total
+    while stack:
+        node, x, level = stack.pop()
+        w = node['value'] * scale
+        if w < 0.1:
+            continue
+        y = height - 10 - (level + 1) * frame_height
+        label = '{} ({:.3f} ms, {:.2f}%)'.format(node['name'], node['value'] * 1e3, 100 * node['value'] / total)
+        fs.write('<g><title>{}</title><rect x="{:.2f}" y="{}" width="{:.2f}" height="{}" fill="{}" rx="2" ry="2"/>'
+                 .format(escape(label), x, y, w, frame_height - 1, _color(node['name'])))
+        n_chars = int((w - 6) / char_width)
+        if n_chars >= 3:
+            text = node['name'] if len(node['name']) <= n_chars else node['name'][:n_chars - 2] + '..'
+            fs.write('<text x="{:.2f}" y="{}" font-size="{}" font-family="Verdana">{}</text>'
+                     .format(x + 3, y + frame_height - 4, font_size, escape(text)))
+        fs.write('</g>\n')
+        child_x = x
+        for child in sorted(node['children'].values(), key=lambda c: c['name']):
+            stack.append((child, child_x, level + 1))
+            child_x += child['value'] * scale
+    fs.write('</svg>\n')
+
+
+def export_flamegraph(pstats_file, collapsed_file=None, svg_file=None, **kwargs):
+    """
+    Export a pstats file (such as the .stats files written by ProfiledThread) as collapsed stacks and / or an SVG
+    flame graph.
+    :param pstats_file: path to the pstats file
+    :param collapsed_file: path of the collapsed-stack file to write (Optional)
+    :param svg_file: path of the SVG file to write (Optional)
+    :param kwargs: keyword arguments passed to collapsed_stacks()
+    """
+    stacks = collapsed_stacks(pstats_file, **kwargs)
+    if collapsed_file:
+        write_collapsed(stacks, collapsed_file)
+    if svg_file:
+        write_svg(stacks, svg_file, title=os.path.basename(pstats_file))
+    return stacks
@@ -0,0 +1,156 @@
+__author__ = 'calvin'
+
+import threading
+
+from pyperform import StringIO
+from .tools import convert_time_units
+
+
+class LatencyHistogram(object):
+    """
+    A thread-safe, fixed-memory histogram of latencies in nanoseconds, in the style of an HDR histogram. Values below
+    2 * 2**sub_bucket_bits are counted exactly; larger values are counted in logarithmic buckets that are each split
+    into 2**sub_bucket_bits linear sub-buckets, so percentiles have a relative error of at most 2**-sub_bucket_bits.
+    Recording a value is O(1), the memory used does not grow with the number of values, and histograms with the same
+    resolution can be merged, which allows histograms from different threads or processes to be combined.
+    """
+    percentiles = (50, 90, 99, 99.9)
+
+    def __init__(self, sub_bucket_bits=5):
+        self._lock = threading.Lock()
+        self.sub_bucket_bits = sub_bucket_bits
+        self._sub_buckets = 1 << sub_bucket_bits
+        # Enough buckets for any 64-bit value
+        self.counts = [0] * ((64 - sub_bucket_bits + 1) * self._sub_buckets)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def bucket_index(self, value):
+        """ Return the index of the bucket that a value is counted in. """
+        if value < 2 * self._sub_buckets:
+            return max(value, 0)
+        shift = value.bit_length() - self.sub_bucket_bits - 1
+        return shift * self._sub_buckets + (value >> shift)
+
+    def bucket_bounds(self, index):
+        """ Return the (lower, upper) bounds of a bucket in nanoseconds. Values in the bucket are < upper. """
+        if index < 2 * self._sub_buckets:
+            return index, index + 1
+        shift = index // self._sub_buckets - 1
+        sub_bucket = index - shift * self._sub_buckets
+        return sub_bucket << shift, (sub_bucket + 1) << shift
+
+    def record(self, value):
+        """
+        Record a latency.
+        :param value: latency in integer nanoseconds
+        """
+        index = self.bucket_index(value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    @property
+    def mean(self):
+        return self.total / float(self.count) if self.count else None
+
+    def percentile(self, q):
+        """
+        Return the q-th percentile of the recorded latencies in nanoseconds, or None if nothing has been recorded.
+        :param q: percentile in the range [0, 100]
+        """
+        with self._lock:
+            counts, count, min_ns, max_ns = self.counts[:], self.count, self.min, self.max
+        if not count:
+            return None
+        rank = max(1, int(round(q / 100. * count)))
+        cumulative = 0
+        for index, n in enumerate(counts):
+            cumulative += n
+            if cumulative >= rank:
+                lower, upper = self.bucket_bounds(index)
+                # The midpoint of the bucket, clipped to the recorded range
+                return min(max((lower + upper - 1) / 2., min_ns), max_ns)
+
+    def merge(self, other):
+        """
+        Add the counts of another histogram to this one.
+        :param other: LatencyHistogram with the same sub_bucket_bits
+        """
+        if other.sub_bucket_bits != self.sub_bucket_bits:
+            raise ValueError('Cannot merge histograms with different resolutions.')
+        other = other.snapshot()
+        with self._lock:
+            self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+            self.count += other.count
+            self.total += other.total
+            if other.min is not None and (self.min is None or other.min < self.min):
+                self.min = other.min
+            if other.max is not None and (self.max is None or other.max > self.max):
+                self.max = other.max
+        return self
+
+    def snapshot(self, reset=False):
+        """
+        Return a copy of the histogram. Recording is only blocked while the counts are copied (or swapped out).
+        :param reset: reset this histogram after taking the snapshot.
+        """
+        snapshot = LatencyHistogram(self.sub_bucket_bits)
+        empty = [0] * len(self.counts) if reset else None
+        with self._lock:
+            if reset:
+                snapshot.counts, self.counts = self.counts, empty
+            else:
+                snapshot.counts = self.counts[:]
+            snapshot.count, snapshot.total, snapshot.min, snapshot.max = self.count, self.total, self.min, self.max
+            if reset:
+                self.count, self.total, self.min, self.max = 0, 0, None, None
+        return snapshot
+
+    def to_dict(self):
+        """ Return a compact dictionary of the histogram that can be serialized (e.g. to JSON) and sent elsewhere. """
+        snapshot = self.snapshot()
+        return {'sub_bucket_bits': snapshot.sub_bucket_bits,
+                'counts': {i: n for i, n in enumerate(snapshot.counts) if n},
+                'count': snapshot.count, 'total': snapshot.total, 'min': snapshot.min, 'max': snapshot.max}
+
+    @classmethod
+    def from_dict(cls, d):
+        """ Create a histogram from the dictionary returned by to_dict(). """
+        histogram = cls(d['sub_bucket_bits'])
+        for index, n in d['counts'].items():
+            histogram.counts[int(index)] = n
+        histogram.count, histogram.total, histogram.min, histogram.max = d['count'], d['total'], d['min'], d['max']
+        return histogram
+
+    def report(self, name=''):
+        """ Return a text report of the recorded latencies. """
+        snapshot = self.snapshot()
+        log = StringIO.StringIO()
+        if not snapshot.count:
+            log.write('{}: no calls\n'.format(name))
+            return log.getvalue()
+        log.write('{}: calls: {} mean: {} min: {} max: {}'.format(name, snapshot.count,
+                                                                  convert_time_units(snapshot.mean * 1e-9),
+                                                                  convert_time_units(snapshot.min * 1e-9),
+                                                                  convert_time_units(snapshot.max * 1e-9)))
+        for q in self.percentiles:
+            log.write(' p{:g}: {}'.format(q, convert_time_units(snapshot.percentile(q) * 1e-9)))
+        log.write('\n')
+        return log.getvalue()
@@ -0,0 +1,170 @@
+__author__ = 'calvin'
+
+import subprocess
+import sys
+import time
+
+from pyperform import StringIO
+from . import stats
+from .tools import convert_time_units
+
+# Script run by each isolated trial. The setup and statement are compiled before they are timed, and the import times
+# that the interpreter reports after the marker line belong to the timed statement.
+_trial_script = """
+import sys, time
+_pyperform_start = time.time()
+_pyperform_timer = getattr(time, 'perf_counter', time.time)
+sys.path[:] = {path!r}
+_pyperform_setup = compile({setup!r}, '<setup>', 'exec')
+_pyperform_stmt = compile({stmt!r}, '<stmt>', 'exec')
+_pyperform_t0 = _pyperform_timer()
+exec(_pyperform_setup)
+_pyperform_t1 = _pyperform_timer()
+sys.stderr.write({marker!r} + '\\n')
+sys.stderr.flush()
+_pyperform_t2 = _pyperform_timer()
+exec(_pyperform_stmt)
+_pyperform_t3 = _pyperform_timer()
+sys.stdout.write('\\n' + {marker!r} + ' %r %r %r\\n' % (_pyperform_start, _pyperform_t1 - _pyperform_t0,
+                                                       _pyperform_t3 - _pyperform_t2))
+"""
+_marker = '_pyperform_isolated_trial'
+
+
+class IsolatedTrialError(Exception):
+    """ Exception raised when the interpreter of an isolated trial fails. """
+    pass
+
+
+def importtime_supported():
+    """ The interpreter reports import times with -X importtime since Python 3.7 """
+    return sys.version_info >= (3, 7)
+
+
+def parse_importtime(stderr):
+    """
+    Parse the import times reported by `python -X importtime`.
+    :param stderr: standard error of the interpreter
+    :return: list of (module, nesting level, self time in seconds, cumulative time in seconds) in the order that the
+             imports finished
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+            self_s, cumulative_s = int(self_us) * 1e-6, int(cumulative_us) * 1e-6
+        except ValueError:
+            # The header line
+            continue
+        module = name.strip()
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((module, level, self_s, cumulative_s))
+    return imports
+
+
+def run_trial(setup, stmt, importtime=True, timeout=None):
+    """
+    Run the setup and then the statement once in a fresh interpreter.
+    :param setup: setup code
+    :param stmt: statement whose first, cold call is timed
+    :param importtime: report the imports made by the statement (Python 3.7+)
+    :param timeout: timeout of the interpreter in seconds (Python 3.3+)
+    :return: dictionary of
+                startup_seconds: time from starting the interpreter until it runs the first line of the trial
+                setup_seconds: time taken by the setup
+                first_call_seconds: time taken by the first call of the statement
+                imports: import times of the statement returned by parse_importtime()
+    """
+    script = _trial_script.format(path=sys.path, setup=setup, stmt=stmt, marker=_marker)
+    command = [sys.executable]
+    if importtime and importtime_supported():
+        command += ['-X', 'importtime']
+    command.append('-')
+    kwargs = {'timeout': timeout} if timeout is not None else {}
+    t_spawn = time.time()
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    stdout, stderr = process.communicate(script, **kwargs)
+
+    result = [line for line in stdout.splitlines() if line.startswith(_marker + ' ')]
+    if process.returncode or not result:
+        error = [line for line in stderr.splitlines() if not line.startswith('import time:')]
+        raise IsolatedTrialError('Isolated trial failed with exit code {}:\n{}'.format(process.returncode,
+                                                                                      '\n'.join(error)))
+    start, setup_seconds, first_call_seconds = [float(v) for v in result[-1].split()[1:]]
+    statement_stderr = stderr[stderr.index(_marker) + len(_marker):]
+    return {'startup_seconds': start - t_spawn,
+            'setup_seconds': setup_seconds,
+            'first_call_seconds': first_call_seconds,
+            'imports': parse_importtime(statement_stderr)}
+
+
+def median_imports(trials):
+    """
+    Combine the import times of several trials into the median self and cumulative time of each module.
+    :param trials: trials returned by run_trial()
+    :return: list of (module, nesting level, median self time, median cumulative time) in the order of the first trial
+    """
+    times = {}
+    order = []
+    for trial in trials:
+        for module, level, self_s, cumulative_s in trial['imports']:
+            if module not in times:
+                times[module] = (level, [], [])
+                order.append(module)
+            times[module][1].append(self_s)
+            times[module][2].append(cumulative_s)
+    return [(m, times[m][0], stats.median(times[m][1]), stats.median(times[m][2])) for m in order]
+
+
+def write_imports(imports, fs=None):
+    """
+    Write import times in the layout of `python -X importtime`, with nested imports indented under the module that
+    imported them.
+    :param imports: list returned by parse_importtime() or median_imports()
+    :param fs: path or file-like object (Optional)
+    """
+    log = StringIO.StringIO()
+    log.write('{: <12} | {: <12} | {}\n'.format('self', 'cumulative', 'imported module'))
+    for module, level, self_s, cumulative_s in imports:
+        log.write('{: <12} | {: <12} | {}{}\n'.format(convert_time_units(self_s), convert_time_units(cumulative_s),
+                                                      '  ' * level, module))
+    if isinstance(fs, str):
+        with open(fs, 'w') as f:
+            f.write(log.getvalue())
+    elif fs is None:
+        print(log.getvalue())
+    else:
+        fs.write(log.getvalue())
+
+
+def measure_import(module, repeat=10, timeout=None):
+    """
+    Measure the cold import time of a module in fresh interpreters.
+    :param module: name of the module, for example 'json' or 'os.path'
+    :param repeat: number of interpreters to run
+    :return: dictionary of the median startup_seconds, setup_seconds and first_call_seconds (the import time) and the
+             median import times of each module imported.
+    """
+    return measure_statement('', 'import {}'.format(module), repeat=repeat, timeout=timeout)
+
+
+def measure_statement(setup, stmt, repeat=10, timeout=None):
+    """
+    Measure the cold first execution of a statement in fresh interpreters.
+    :param repeat: number of interpreters to run
+    :return: dictionary of the median startup_seconds, setup_seconds and first_call_seconds and the median import
+             times of each module imported by the statement.
+    """
+    trials = [run_trial(setup, stmt, timeout=timeout) for _ in range(repeat)]
+    result = {k: stats.median([t[k] for t in trials])
+              for k in ('startup_seconds', 'setup_seconds', 'first_call_seconds')}
+    result['imports'] = median_imports(trials)
+    return result
+
+
+def measure_startup(repeat=10, timeout=None):
+    """ Return the median time that it takes to start the interpreter, in seconds. """
+    return measure_statement('', 'pass', repeat=repeat, timeout=timeout)['startup_seconds']
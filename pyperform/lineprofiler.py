@@ -0,0 +1,239 @@
+__author__ = 'calvin'
+
+import inspect
+import linecache
+import sys
+from timeit import default_timer
+
+from pyperform import StringIO
+from .tools import convert_time_units
+
+# File name that the setup source is compiled with, so that the lines of the benchmarked function can be found
+setup_filename = '<pyperform-setup>'
+
+
+class LineTracer(object):
+    """
+    Count the hits and the time spent on each line of a set of code objects. The time of a line is the time from the
+    line starting until the next line of the same frame starts (or the frame returns), so it includes the time spent in
+    the functions called from the line and the overhead of tracing.
+
+    Python 3.12+ uses the low overhead sys.monitoring API and other versions use sys.settrace().
+
+    Usage:
+
+        with LineTracer([func.__code__]) as tracer:
+            func()
+        tracer.lines  # {(code, line number): [hits, seconds]}
+    """
+
+    def __init__(self, codes):
+        self.codes = set(codes)
+        self.lines = {}
+        # Line number and start time of the line that is running in each traced frame
+        self._frames = {}
+        self._stack = []
+        self._previous_trace = None
+        self._monitoring_tool = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        monitoring = getattr(sys, 'monitoring', None)
+        if monitoring is not None:
+            try:
+                monitoring.use_tool_id(monitoring.PROFILER_ID, 'pyperform')
+            except ValueError:
+                # Another profiler holds the tool id, fall back to sys.settrace()
+                pass
+            else:
+                self._monitoring_tool = monitoring.PROFILER_ID
+                self._start_monitoring(monitoring)
+                return
+        self._previous_trace = sys.gettrace()
+        sys.settrace(self._trace_calls)
+
+    def stop(self):
+        if self._monitoring_tool is not None:
+            self._stop_monitoring(sys.monitoring)
+            self._monitoring_tool = None
+        else:
+            sys.settrace(self._previous_trace)
+        self._frames.clear()
+        del self._stack[:]
+
+    def _add(self, code, lineno, t_start, t_end):
+        try:
+            entry = self.lines[(code, lineno)]
+        except KeyError:
+            entry = self.lines[(code, lineno)] = [0, 0.]
+        entry[0] += 1
+        entry[1] += t_end - t_start
+
+    # sys.settrace() implementation
+
+    def _trace_calls(self, frame, event, arg):
+        if event == 'call' and frame.f_code in self.codes:
+            return self._trace_lines
+        return None
+
+    def _trace_lines(self, frame, event, arg):
+        t = default_timer()
+        if event == 'line':
+            previous = self._frames.get(frame)
+            if previous is not None:
+                self._add(frame.f_code, previous[0], previous[1], t)
+            self._frames[frame] = (frame.f_lineno, default_timer())
+        elif event == 'return':
+            # Also sent when a generator or coroutine yields, the time that it is suspended is not counted
+            previous = self._frames.pop(frame, None)
+            if previous is not None:
+                self._add(frame.f_code, previous[0], previous[1], t)
+        return self._trace_lines
+
+    # sys.monitoring implementation (Python 3.12+). The callbacks are not given the frame, so the frames of the traced
+    # code objects are kept on a stack.
+
+    def _start_monitoring(self, monitoring):
+        events = monitoring.events
+        tool = self._monitoring_tool
+        monitoring.register_callback(tool, events.PY_START, self._monitor_start)
+        monitoring.register_callback(tool, events.PY_RESUME, self._monitor_start)
+        monitoring.register_callback(tool, events.PY_RETURN, self._monitor_return)
+        monitoring.register_callback(tool, events.PY_YIELD, self._monitor_return)
+        monitoring.register_callback(tool, events.LINE, self._monitor_line)
+        # A frame that is left by an exception, or a generator that is resumed by throw(), does not send PY_RETURN or
+        # PY_RESUME. These events can not be set per code object, so they are filtered in the callbacks.
+        monitoring.register_callback(tool, events.PY_UNWIND, self._monitor_unwind)
+        monitoring.register_callback(tool, events.PY_THROW, self._monitor_throw)
+        for code in self.codes:
+            monitoring.set_local_events(tool, code, events.PY_START | events.PY_RESUME | events.PY_RETURN |
+                                        events.PY_YIELD | events.LINE)
+        monitoring.set_events(tool, events.PY_UNWIND | events.PY_THROW)
+
+    def _stop_monitoring(self, monitoring):
+        events = monitoring.events
+        tool = self._monitoring_tool
+        for code in self.codes:
+            monitoring.set_local_events(tool, code, 0)
+        monitoring.set_events(tool, 0)
+        for event in (events.PY_START, events.PY_RESUME, events.PY_RETURN, events.PY_YIELD, events.LINE,
+                      events.PY_UNWIND, events.PY_THROW):
+            monitoring.register_callback(tool, event, None)
+        monitoring.free_tool_id(tool)
+
+    def _monitor_start(self, code, offset):
+        self._stack.append([code, None, 0.])
+
+    def _monitor_line(self, code, lineno):
+        t = default_timer()
+        if not self._stack:
+            return
+        current = self._stack[-1]
+        if current[1] is not None:
+            self._add(code, current[1], current[2], t)
+        current[1] = lineno
+        current[2] = default_timer()
+
+    def _monitor_return(self, code, offset, retval):
+        t = default_timer()
+        if not self._stack:
+            return
+        code, lineno, t_start = self._stack.pop()
+        if lineno is not None:
+            self._add(code, lineno, t_start, t)
+
+    def _monitor_unwind(self, code, offset, exception):
+        if code in self.codes:
+            self._monitor_return(code, offset, exception)
+
+    def _monitor_throw(self, code, offset, exception):
+        if code in self.codes:
+            self._monitor_start(code, offset)
+
+
+def find_code(code, name, def_line=None):
+    """
+    Find the code objects of the functions named `name` that are defined in compiled code, including methods and nested
+    functions.
+    :param def_line: only return the functions whose `def` line matches this source line, ignoring indentation
+                     (Optional)
+    """
+    found = []
+    for const in code.co_consts:
+        if not inspect.iscode(const):
+            continue
+        if const.co_name == name:
+            found.append(const)
+        found.extend(find_code(const, name))
+    if def_line is not None:
+        def_line = def_line.strip()
+        matching = [c for c in found if def_line in (l.strip() for l in function_lines(c))]
+        # The source may have been modified before it was compiled, in which case all functions of that name are used
+        if matching:
+            return matching
+    return found
+
+
+def function_lines(code):
+    """ Return the source lines of the function that a code object was compiled from. """
+    lines = linecache.getlines(code.co_filename)
+    if not lines:
+        return []
+    try:
+        return inspect.getblock(lines[code.co_firstlineno - 1:])
+    except (IndexError, SyntaxError):
+        return []
+
+
+def line_times(tracer, codes, iterations):
+    """
+    Combine the hits and times recorded by a LineTracer into a line by line listing of the source of the traced
+    functions.
+    :param iterations: number of calls that were traced
+    :return: list of (line number in the function starting at 1, source line, hits per call, seconds per call)
+    """
+    listing = []
+    for code in sorted(codes, key=lambda c: (c.co_filename, c.co_firstlineno)):
+        for i, src in enumerate(function_lines(code)):
+            hits, seconds = tracer.lines.get((code, code.co_firstlineno + i), (0, 0.))
+            listing.append((len(listing) + 1, src.rstrip('\n'), hits / float(iterations), seconds / iterations))
+    return listing
+
+
+def register_source(setup):
+    """
+    Compile the setup source under setup_filename. Its lines are added to the linecache so that the source of the
+    functions that it defines can be listed.
+    """
+    linecache.cache[setup_filename] = (len(setup), None, setup.splitlines(True), setup_filename)
+    return compile(setup, setup_filename, 'exec')
+
+
+def write_line_times(listing, fs=None):
+    """
+    Write the source of a benchmarked function with the hits and time per call of each line next to it.
+    :param listing: list returned by line_times()
+    :param fs: path or file-like object (Optional)
+    """
+    total = sum(l[3] for l in listing)
+    log = StringIO.StringIO()
+    log.write('{: >6} {: >10} {: >12} {: >7}  {}\n'.format('Line', 'Hits', 'Time', '% Time', 'Source'))
+    for lineno, src, hits, seconds in listing:
+        if hits:
+            log.write('{: >6} {: >10.4g} {: >12} {: >7.1f}  {}\n'.format(lineno, hits, convert_time_units(seconds),
+                                                                       100. * seconds / total if total else 0, src))
+        else:
+            log.write('{: >6} {: >10} {: >12} {: >7}  {}\n'.format(lineno, '', '', '', src))
+    if isinstance(fs, str):
+        with open(fs, 'w') as f:
+            f.write(log.getvalue())
+    elif fs is None:
+        print(log.getvalue())
+    else:
+        fs.write(log.getvalue())
@@ -0,0 +1,103 @@
+__author__ = 'calvin'
+
+import logging
+import multiprocessing
+from collections import OrderedDict
+
+from .benchmark import Benchmark
+from .comparisonbenchmark import ComparisonBenchmark
+from .tools import available_cpus, set_cpu_affinity
+
+
+def _get_context():
+    """ Workers look up the benchmarks in the registry they inherit from the parent, so they must be forked. """
+    try:
+        return multiprocessing.get_context('fork')
+    except AttributeError:
+        # Python 2.x always forks on posix systems
+        return multiprocessing
+    except ValueError:
+        return None
+
+
+def _init_worker(cpus, counter):
+    """ Pin each worker to its own CPU. """
+    if cpus:
+        with counter.get_lock():
+            idx = counter.value
+            counter.value += 1
+        set_cpu_affinity([cpus[idx % len(cpus)]])
+
+
+def _run_unit(unit):
+    """
+    Run a unit of work in a worker process and return the results of every benchmark that was measured.
+    :param unit: tuple of (registry indices, group)
+    """
+    indices, group = unit
+    results = []
+    for idx in indices:
+        benchmark = Benchmark.registry[idx]
+        benchmark.run(group=group)
+        results.append((idx, [b.results() for b in benchmark.members(group)]))
+    return results
+
+
+def _units(group=None):
+    """
+    Split the registry into independent units of work. All ComparisonBenchmarks of a group are kept together so that
+    they are measured (and validated) in the same process.
+    """
+    units = OrderedDict()
+    for idx, benchmark in enumerate(Benchmark.registry):
+        if not benchmark.members(group):
+            continue
+        if isinstance(benchmark, ComparisonBenchmark):
+            key = ('group', benchmark.group)
+        else:
+            key = ('benchmark', idx)
+        units.setdefault(key, []).append(idx)
+    return [(indices, group) for indices in units.values()]
+
+
+def run_parallel(group=None, processes=None, pin_cpus=False):
+    """
+    Run the deferred benchmarks in the registry using a pool of worker processes. Each worker runs one unit
+    (a comparison group, a benchmarked class or a benchmarked function) at a time and the results are merged back into
+    the benchmarks of this process, so ComparisonBenchmark.summarize() can be used afterwards.
+    :param group: name of the comparison group to run. If None, all benchmarks are run.
+    :param processes: number of worker processes. Defaults to the number of available CPUs.
+    :param pin_cpus: pin each worker process to its own CPU.
+    """
+    units = _units(group)
+    if not units:
+        return
+
+    context = _get_context()
+    if context is None:
+        logging.warning('PyPerform: Parallel benchmarks require the fork start method. Running benchmarks serially.')
+        for indices, _group in units:
+            for idx in indices:
+                Benchmark.registry[idx].run(group=_group)
+        return
+
+    cpus = available_cpus()
+    if processes is None:
+        processes = len(cpus)
+    if pin_cpus:
+        processes = min(processes, len(cpus))
+    processes = max(1, min(processes, len(units)))
+
+    counter = context.Value('i', 0)
+    pool = context.Pool(processes, initializer=_init_worker, initargs=(cpus if pin_cpus else None, counter))
+    try:
+        for unit_results in pool.imap_unordered(_run_unit, units, chunksize=1):
+            for idx, results in unit_results:
+                for benchmark, result in zip(Benchmark.registry[idx].members(group), results):
+                    benchmark.load_results(result)
+    except Exception:
+        pool.terminate()
+        raise
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,135 @@
+__author__ = 'calvin'
+
+import fnmatch
+import marshal
+import multiprocessing
+import os
+import pstats
+
+from pyperform import StringIO
+
+
+class StatsContainer(object):
+    """
+    Holds a pstats dictionary so that it can be passed to pstats.Stats() without writing it to a file.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def find_stats_files(profile_dir, pattern=None, exclude=()):
+    """
+    Return the paths of the .stats files in a directory.
+    :param profile_dir: directory of .stats files
+    :param pattern: glob pattern that the name of the profile (the file name without .stats, for example
+                    'Thread-Worker-1') must match (Optional)
+    :param exclude: file names to leave out
+    """
+    paths = []
+    for f in sorted(os.listdir(profile_dir)):
+        path = os.path.join(profile_dir, f)
+        if not f.endswith('.stats') or f in exclude or not os.path.isfile(path):
+            continue
+        if pattern is not None and not fnmatch.fnmatch(f[:-len('.stats')], pattern):
+            continue
+        paths.append(path)
+    return paths
+
+
+def load_stats(path):
+    """ Load the pstats dictionary of a .stats file. """
+    with open(path, 'rb') as f:
+        return marshal.load(f)
+
+
+def write_stats(stats, path):
+    """ Write a pstats dictionary to a binary .stats file that can be read by pstats.Stats(). """
+    with open(path, 'wb') as f:
+        marshal.dump(stats, f)
+
+
+def write_report(stats, path, sortby='cumulative'):
+    """ Write a readable pstats text report of a pstats dictionary. """
+    s = StringIO.StringIO()
+    ps = pstats.Stats(StatsContainer(stats), stream=s)
+    ps.strip_dirs()
+    ps.sort_stats(sortby)
+    ps.print_stats()
+    with open(path, 'w') as f:
+        f.write(s.getvalue())
+
+
+def _add_callers(target, source):
+    for caller, value in source.items():
+        if caller in target:
+            if isinstance(value, tuple):
+                target[caller] = tuple(a + b for a, b in zip(target[caller], value))
+            else:
+                target[caller] += value
+        else:
+            target[caller] = value
+
+
+def add_stats(target, source):
+    """
+    Add the statistics of one pstats dictionary to another, in place (like pstats.Stats.add).
+    :return: target
+    """
+    for func, (cc, nc, tt, ct, callers) in source.items():
+        if func in target:
+            t_cc, t_nc, t_tt, t_ct, t_callers = target[func]
+            _add_callers(t_callers, callers)
+            target[func] = t_cc + cc, t_nc + nc, t_tt + tt, t_ct + ct, t_callers
+        else:
+            target[func] = cc, nc, tt, ct, dict(callers)
+    return target
+
+
+def merge_files(paths):
+    """
+    Merge .stats files one at a time, so that only the merged result and a single input are held in memory.
+    :return: merged pstats dictionary
+    """
+    merged = {}
+    for path in paths:
+        add_stats(merged, load_stats(path))
+    return merged
+
+
+def _merge_pair(pair):
+    a, b = pair
+    return add_stats(a, b) if b is not None else a
+
+
+def merge_profiles(paths, processes=None):
+    """
+    Merge many .stats files with a tree reduction. The files are split into one chunk per worker process, each chunk
+    is merged by streaming its files, and the partial results are then merged pairwise in parallel until one remains.
+    :param paths: paths of .stats files
+    :param processes: number of worker processes. Defaults to the number of CPUs. With 1, the files are merged in this
+                      process.
+    :return: merged pstats dictionary
+    """
+    paths = list(paths)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(paths)))
+    if processes == 1:
+        return merge_files(paths)
+
+    chunks = [paths[i::processes] for i in range(processes)]
+    pool = multiprocessing.Pool(processes)
+    try:
+        partials = pool.map(merge_files, chunks)
+        while len(partials) > 1:
+            pairs = [(partials[i], partials[i + 1] if i + 1 < len(partials) else None)
+                     for i in range(0, len(partials), 2)]
+            partials = pool.map(_merge_pair, pairs)
+    finally:
+        pool.close()
+        pool.join()
+    return partials[0]
@@ -0,0 +1,286 @@
+__author__ = 'calvin'
+
+import csv
+import json
+import sys
+from xml.sax.saxutils import escape
+
+from .comparisonbenchmark import ComparisonBenchmark
+from .tools import convert_time_units, environment
+from . import stats
+
+
+def benchmark_record(benchmark):
+    """ Return the results of a benchmark as a dictionary of plain values that can be serialized. """
+    ci = benchmark.time_ci_seconds or (None, None)
+    record = {'group': benchmark.group,
+              'function': benchmark.full_name,
+              'source_hash': benchmark.source_hash,
+              'time_median_seconds': benchmark.time_median_seconds,
+              'time_average_seconds': benchmark.time_average_seconds,
+              'time_min_seconds': benchmark.time_min_seconds,
+              'time_iqr_seconds': benchmark.time_iqr_seconds,
+              'time_stdev_seconds': benchmark.time_stdev_seconds,
+              'time_ci_low_seconds': ci[0],
+              'time_ci_high_seconds': ci[1],
+              'confidence_level': benchmark.confidence_level,
+              'relative_precision': benchmark.relative_precision,
+              'timeit_repeat': benchmark.timeit_repeat,
+              'timeit_number': benchmark.loops,
+              'memory_peak_bytes': benchmark.memory_peak_bytes,
+              'memory_retained_bytes': benchmark.memory_retained_bytes,
+              'memory_allocations': benchmark.memory_allocations,
+              'throughput': benchmark.throughput,
+              'settings': benchmark.settings,
+              'trials': list(benchmark.trials)}
+    if getattr(benchmark, 'line_times', None):
+        record['line_times'] = [{'line': line, 'source': src, 'hits': hits, 'seconds': seconds}
+                                for line, src, hits, seconds in benchmark.line_times]
+    if getattr(benchmark, 'sweep', None):
+        # SweepBenchmarks
+        record['sweep'] = [list(pair) for pair in benchmark.sweep]
+        record['complexity'] = benchmark.complexity.name if benchmark.complexity else None
+    return record
+
+
+class Exporter(object):
+    """
+    Base class of the structured result exporters. Groups are written one at a time as write_group() is called, so
+    any number of groups can be streamed into one file without holding the whole report in memory. close() writes
+    the end of the report.
+
+    Usage:
+
+        with JSONExporter('results.json') as exporter:
+            for group in ComparisonBenchmark.groups:
+                exporter.write_group(group)
+
+    """
+
+    def __init__(self, fs=None):
+        """
+        :param fs: path or file-like object. If None, the report is written to standard out.
+        """
+        self._owns_file = isinstance(fs, str)
+        if self._owns_file:
+            self.fs = self.open(fs)
+        else:
+            self.fs = fs if fs is not None else sys.stdout
+        self.environment = environment()
+        self.n_groups = 0
+        self.closed = False
+        self.begin()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self, path):
+        return open(path, 'w')
+
+    def write_group(self, group, benchmarks=None):
+        """
+        Write the results of a group. Benchmarks that have not been run are skipped.
+        :param group: name of the group
+        :param benchmarks: benchmarks of the group. Defaults to the ComparisonBenchmarks of the group.
+        """
+        if benchmarks is None:
+            benchmarks = ComparisonBenchmark.groups[group]
+        benchmarks = sorted((b for b in benchmarks if b.trials), key=lambda b: b.time_median_seconds)
+        self.write_benchmarks(group, benchmarks)
+        self.n_groups += 1
+
+    def close(self):
+        if self.closed:
+            return
+        self.end()
+        self.closed = True
+        if self._owns_file:
+            self.fs.close()
+
+    def begin(self):
+        pass
+
+    def write_benchmarks(self, group, benchmarks):
+        raise NotImplementedError
+
+    def end(self):
+        pass
+
+
+class JSONExporter(Exporter):
+    """
+    Writes a JSON document of the form {"environment": {...}, "groups": {"<group>": [<benchmark record>, ...], ...}}
+    """
+
+    def begin(self):
+        self.fs.write('{{"environment": {}, "groups": {{'.format(json.dumps(self.environment, sort_keys=True)))
+
+    def write_benchmarks(self, group, benchmarks):
+        if self.n_groups:
+            self.fs.write(',')
+        self.fs.write('\n{}: ['.format(json.dumps(str(group))))
+        for i, b in enumerate(benchmarks):
+            self.fs.write('{}\n  {}'.format(',' if i else '', json.dumps(benchmark_record(b), sort_keys=True)))
+        self.fs.write('\n]')
+
+    def end(self):
+        self.fs.write('}}\n')
+
+
+class CSVExporter(Exporter):
+    """
+    Writes one row per benchmark, with the environment in every row. Settings are written as JSON and the individual
+    trials are left out.
+    """
+    columns = ('group', 'function', 'time_median_seconds', 'time_average_seconds', 'time_min_seconds',
+               'time_iqr_seconds', 'time_stdev_seconds', 'time_ci_low_seconds', 'time_ci_high_seconds',
+               'confidence_level', 'relative_precision', 'timeit_repeat', 'timeit_number', 'memory_peak_bytes',
+               'memory_retained_bytes', 'memory_allocations', 'throughput', 'settings', 'source_hash')
+    environment_columns = ('machine', 'platform', 'processor', 'python_version')
+
+    def open(self, path):
+        if sys.version_info[0] == 3:
+            return open(path, 'w', newline='')
+        return open(path, 'wb')
+
+    def begin(self):
+        self.writer = csv.writer(self.fs)
+        self.writer.writerow(self.columns + self.environment_columns)
+
+    def write_benchmarks(self, group, benchmarks):
+        env = [self.environment[c] for c in self.environment_columns]
+        for b in benchmarks:
+            record = benchmark_record(b)
+            record['settings'] = json.dumps(record['settings'], sort_keys=True)
+            self.writer.writerow([record[c] for c in self.columns] + env)
+
+
+class HTMLExporter(Exporter):
+    """
+    Writes a self-contained HTML report. Each group has a table of statistics, a bar chart of the median times with
+    their confidence intervals and a box plot of the per-call times of the trials.
+    """
+    width = 800
+    row_height = 24
+    label_width = 240
+
+    def __init__(self, fs=None, title='PyPerform Report'):
+        self.title = title
+        super(HTMLExporter, self).__init__(fs)
+
+    def begin(self):
+        self.fs.write('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>{}</title>\n'
+                      .format(escape(self.title)))
+        self.fs.write('<style>\nbody {font-family: Verdana, sans-serif; font-size: 13px; margin: 20px;}\n'
+                      'table {border-collapse: collapse; margin-bottom: 12px;}\n'
+                      'th, td {border: 1px solid #ccc; padding: 3px 8px; text-align: right;}\n'
+                      'th:first-child, td:first-child {text-align: left;}\n'
+                      'th {background: #eee;}\nsvg {display: block; margin-bottom: 12px;}\n</style>\n</head>\n<body>\n')
+        self.fs.write('<h1>{}</h1>\n<table>\n'.format(escape(self.title)))
+        for key, value in sorted(self.environment.items()):
+            self.fs.write('<tr><th>{}</th><td>{}</td></tr>\n'.format(escape(key), escape(str(value))))
+        self.fs.write('</table>\n')
+
+    def write_benchmarks(self, group, benchmarks):
+        self.fs.write('<h2>{}</h2>\n'.format(escape(str(group))))
+        if not benchmarks:
+            self.fs.write('<p>No results.</p>\n')
+            return
+        self.write_table(benchmarks)
+        self.write_bar_chart(benchmarks)
+        self.write_box_plot(benchmarks)
+
+    def write_table(self, benchmarks):
+        headers = ('Function', 'Median', 'Mean', 'Min', 'IQR', 'Std Dev',
+                   '{:.0f}% CI (median)'.format(100 * benchmarks[0].confidence_level), 'timeit_repeat',
+                   'timeit_number')
+        self.fs.write('<table>\n<tr>{}</tr>\n'.format(''.join('<th>{}</th>'.format(escape(h)) for h in headers)))
+        for b in benchmarks:
+            ci = 'n/a' if b.time_ci_seconds is None else '[{}, {}]'.format(*map(convert_time_units, b.time_ci_seconds))
+            row = (b.full_name, convert_time_units(b.time_median_seconds), convert_time_units(b.time_average_seconds),
+                   convert_time_units(b.time_min_seconds), convert_time_units(b.time_iqr_seconds),
+                   'n/a' if b.time_stdev_seconds is None else convert_time_units(b.time_stdev_seconds), ci,
+                   b.timeit_repeat, b.loops)
+            self.fs.write('<tr>{}</tr>\n'.format(''.join('<td>{}</td>'.format(escape(str(v))) for v in row)))
+        self.fs.write('</table>\n')
+
+    def _chart(self, benchmarks, title, scale_max):
+        """ Write the start of a chart and return a function that converts times to x coordinates. """
+        height = (len(benchmarks) + 1) * self.row_height + 10
+        # Leave room on the right for the value labels
+        plot_width = self.width - self.label_width - 90
+        self.fs.write('<svg width="{w}" height="{h}" viewBox="0 0 {w} {h}" xmlns="http://www.w3.org/2000/svg">\n'
+                      .format(w=self.width, h=height))
+        self.fs.write('<text x="{}" y="15" font-size="13" font-weight="bold">{}</text>\n'
+                      .format(self.label_width, escape(title)))
+        for i, b in enumerate(benchmarks):
+            self.fs.write('<text x="{}" y="{}" font-size="12" text-anchor="end">{}</text>\n'
+                          .format(self.label_width - 8, (i + 1) * self.row_height + 16, escape(b.full_name)))
+
+        def x(seconds):
+            return self.label_width + plot_width * seconds / (scale_max or 1.)
+        return x
+
+    def write_bar_chart(self, benchmarks):
+        """ Horizontal bars of the median times, with the confidence interval of the median as error bars. """
+        scale_max = max(b.time_ci_seconds[1] if b.time_ci_seconds else b.time_median_seconds for b in benchmarks)
+        x = self._chart(benchmarks, 'Median time per call', scale_max)
+        for i, b in enumerate(benchmarks):
+            y = (i + 1) * self.row_height + 4
+            self.fs.write('<g><title>{}: {}</title><rect x="{:.1f}" y="{}" width="{:.1f}" height="{}" fill="#4c78a8"/>'
+                          .format(escape(b.full_name), convert_time_units(b.time_median_seconds), x(0), y,
+                                  x(b.time_median_seconds) - x(0), self.row_height - 8))
+            if b.time_ci_seconds:
+                y_mid = y + (self.row_height - 8) / 2.
+                self.fs.write('<line x1="{:.1f}" x2="{:.1f}" y1="{:.1f}" y2="{:.1f}" stroke="#222"/>'
+                              .format(x(b.time_ci_seconds[0]), x(b.time_ci_seconds[1]), y_mid, y_mid))
+            self.fs.write('<text x="{:.1f}" y="{}" font-size="11">{}</text></g>\n'
+                          .format(x(b.time_median_seconds) + 4, y + 11,
+                                  convert_time_units(b.time_median_seconds)))
+        self.fs.write('</svg>\n')
+
+    def write_box_plot(self, benchmarks):
+        """ Box plots of the per-call times of the trials: quartiles, median and the range of the trials. """
+        scale_max = max(max(b.trials) for b in benchmarks)
+        x = self._chart(benchmarks, 'Time per call of each trial', scale_max)
+        for i, b in enumerate(benchmarks):
+            trials = sorted(b.trials)
+            q1, q2, q3 = [stats.percentile(trials, q) for q in (25, 50, 75)]
+            y = (i + 1) * self.row_height + 4
+            h = self.row_height - 8
+            y_mid = y + h / 2.
+            label = '{}: min {} Q1 {} median {} Q3 {} max {}'.format(
+                b.full_name, *map(convert_time_units, (trials[0], q1, q2, q3, trials[-1])))
+            self.fs.write('<g><title>{}</title>'.format(escape(label)))
+            self.fs.write('<line x1="{:.1f}" x2="{:.1f}" y1="{:.1f}" y2="{:.1f}" stroke="#222"/>'
+                          .format(x(trials[0]), x(trials[-1]), y_mid, y_mid))
+            self.fs.write('<rect x="{:.1f}" y="{}" width="{:.1f}" height="{}" fill="#f58518" stroke="#222"/>'
+                          .format(x(q1), y, max(x(q3) - x(q1), 1.), h))
+            self.fs.write('<line x1="{0:.1f}" x2="{0:.1f}" y1="{1}" y2="{2}" stroke="#222" stroke-width="2"/></g>\n'
+                          .format(x(q2), y, y + h))
+        self.fs.write('</svg>\n')
+
+    def end(self):
+        self.fs.write('</body>\n</html>\n')
+
+
+exporters = {'json': JSONExporter,
+             'csv': CSVExporter,
+             'html': HTMLExporter}
+
+
+def export(fs=None, format='json', groups=None):
+    """
+    Export the results of ComparisonBenchmark groups.
+    :param fs: path or file-like object. If None, the report is written to standard out.
+    :param format: 'json', 'csv' or 'html'
+    :param groups: names of the groups to export. Defaults to every group.
+    """
+    if groups is None:
+        groups = sorted(ComparisonBenchmark.groups)
+    with exporters[format](fs) as exporter:
+        for group in groups:
+            exporter.write_group(group)
@@ -0,0 +1,214 @@
+__author__ = 'calvin'
+
+import json
+import logging
+import sqlite3
+import time
+from collections import namedtuple
+
+from pyperform import StringIO
+from .benchmark import Benchmark
+from .comparisonbenchmark import ComparisonBenchmark
+from .tools import convert_time_units, environment
+from . import stats
+
+Comparison = namedtuple('Comparison', ('group', 'function', 'machine', 'python_version', 'baseline_median',
+                                       'candidate_median', 'change', 'p_value', 'status'))
+
+
+class ResultStore(object):
+    """
+    A SQLite database of benchmark results. Every result is keyed by its group, function name, a hash of the benchmarked
+    source, the machine and the Python version, and is tagged with a label (for example a release version) so that
+    the results of different runs can be compared.
+
+    Usage:
+
+        store = ResultStore('results.db')
+        store.save_all(label='1.2.0')
+        ...
+        store.save_all(label='1.3.0')
+        ResultStore.summarize_comparison(store.compare('1.2.0', '1.3.0'))
+
+    """
+    REGRESSED = 'regressed'
+    IMPROVED = 'improved'
+    UNCHANGED = 'unchanged'
+    # The median time changed by more than the threshold, but there are too few trials for the test to be significant
+    INCONCLUSIVE = 'inconclusive'
+
+    _schema = """CREATE TABLE IF NOT EXISTS results (
+                     id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     label TEXT,
+                     timestamp REAL,
+                     group_name TEXT,
+                     function TEXT,
+                     source_hash TEXT,
+                     machine TEXT,
+                     python_version TEXT,
+                     time_median_seconds REAL,
+                     time_average_seconds REAL,
+                     time_min_seconds REAL,
+                     timeit_repeat INTEGER,
+                     timeit_number INTEGER,
+                     trials TEXT,
+                     settings TEXT)"""
+    _index = """CREATE INDEX IF NOT EXISTS results_key ON results
+                    (label, group_name, function, machine, python_version)"""
+    _columns = ('label', 'timestamp', 'group_name', 'function', 'source_hash', 'machine', 'python_version',
+                'time_median_seconds', 'time_average_seconds', 'time_min_seconds', 'timeit_repeat', 'timeit_number',
+                'trials', 'settings')
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute(self._schema)
+            self.connection.execute(self._index)
+            columns = [row[1] for row in self.connection.execute('PRAGMA table_info(results)')]
+            if 'settings' not in columns:
+                # Databases created before the measurement settings were recorded
+                self.connection.execute('ALTER TABLE results ADD COLUMN settings TEXT')
+
+    def close(self):
+        self.connection.close()
+
+    def save(self, benchmarks, label=None):
+        """
+        Save the results of benchmarks. Benchmarks that have not been run are skipped.
+        :param benchmarks: iterable of Benchmarks
+        :param label: label of the run (Optional)
+        :return: the number of results saved
+        """
+        env = environment()
+        timestamp = time.time()
+        rows = []
+        for b in benchmarks:
+            if not b.trials:
+                continue
+            rows.append((label, timestamp, b.group, b.full_name, b.source_hash, env['machine'], env['python_version'],
+                         b.time_median_seconds, b.time_average_seconds, b.time_min_seconds, b.timeit_repeat,
+                         b.loops, json.dumps(list(b.trials)), json.dumps(b.settings)))
+
+        with self.connection:
+            self.connection.executemany('INSERT INTO results ({}) VALUES ({})'
+                                        .format(', '.join(self._columns), ', '.join('?' * len(self._columns))), rows)
+        return len(rows)
+
+    def save_group(self, group, label=None):
+        """ Save the results of a ComparisonBenchmark group. """
+        return self.save(ComparisonBenchmark.groups[group], label=label)
+
+    def save_all(self, label=None):
+        """ Save the results of every ComparisonBenchmark and of every benchmark in the registry. """
+        benchmarks = [b for group in ComparisonBenchmark.groups.values() for b in group]
+        for benchmark in Benchmark.registry:
+            for b in benchmark.members():
+                if b not in benchmarks:
+                    benchmarks.append(b)
+        return self.save(benchmarks, label=label)
+
+    def load(self, label=None, group=None, machine=None, python_version=None):
+        """
+        Load the most recent result of each benchmark that matches the given filters.
+        :return: list of dictionaries, one per result.
+        """
+        conditions, params = [], []
+        for column, value in (('label', label), ('group_name', group), ('machine', machine),
+                              ('python_version', python_version)):
+            if value is not None:
+                conditions.append('{} = ?'.format(column))
+                params.append(value)
+        query = 'SELECT {} FROM results'.format(', '.join(self._columns))
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY timestamp, id'
+
+        latest = {}
+        for row in self.connection.execute(query, params):
+            record = dict(zip(self._columns, row))
+            record['trials'] = json.loads(record['trials'])
+            record['settings'] = json.loads(record['settings']) if record['settings'] else None
+            latest[(record['group_name'], record['function'], record['machine'], record['python_version'])] = record
+        return list(latest.values())
+
+    def compare(self, baseline, candidate, threshold=0.05, alpha=0.05, group=None):
+        """
+        Compare the results of a candidate run against a baseline run. Results are matched by group, function, machine
+        and Python version. A benchmark is marked as regressed (or improved) if its median time changed by more than
+        `threshold` and a Mann-Whitney U test of the trials gives a p-value below `alpha`. If the median changed by more
+        than `threshold` but the test can not reach `alpha` with the number of trials (for example 3 against 3 at
+        alpha=0.05), or if the baseline median time is 0, the benchmark is marked as inconclusive and its change is None.
+        :param baseline: label of the baseline run
+        :param candidate: label of the candidate run
+        :param threshold: minimum relative change of the median time
+        :param alpha: significance level of the statistical test
+        :param group: only compare the benchmarks of this group (Optional)
+        :return: list of Comparisons, sorted from the largest regression to the largest improvement.
+        """
+        def key(r):
+            return r['group_name'], r['function'], r['machine'], r['python_version']
+
+        baseline_results = {key(r): r for r in self.load(label=baseline, group=group)}
+        comparisons = []
+        for c in self.load(label=candidate, group=group):
+            b = baseline_results.get(key(c))
+            if b is None:
+                continue
+            _, p_value = stats.mann_whitney_u(b['trials'], c['trials'])
+            if not b['time_median_seconds']:
+                # The clock could not resolve the baseline, so there is no relative change
+                logging.warning('PyPerform: The baseline median time of {} is 0. Increase timeit_number.'
+                                .format(c['function']))
+                change = None
+                status = self.INCONCLUSIVE
+            else:
+                change = c['time_median_seconds'] / b['time_median_seconds'] - 1
+                if abs(change) > threshold and \
+                        stats.mann_whitney_min_p(len(b['trials']), len(c['trials'])) >= alpha:
+                    logging.warning('PyPerform: {} has too few trials ({} and {}) for a significant test at '
+                                    'alpha={}. Increase timeit_repeat.'.format(c['function'], len(b['trials']),
+                                                                               len(c['trials']), alpha))
+                    status = self.INCONCLUSIVE
+                elif p_value < alpha and change > threshold:
+                    status = self.REGRESSED
+                elif p_value < alpha and change < -threshold:
+                    status = self.IMPROVED
+                else:
+                    status = self.UNCHANGED
+            comparisons.append(Comparison(c['group_name'], c['function'], c['machine'], c['python_version'],
+                                          b['time_median_seconds'], c['time_median_seconds'], change, p_value, status))
+        # Comparisons without a relative change are listed last
+        comparisons.sort(key=lambda c: (c.change is not None, c.change or 0), reverse=True)
+        return comparisons
+
+    @staticmethod
+    def summarize_comparison(comparisons, fs=None):
+        """
+        Tabulate and write a list of Comparisons to a file or standard out.
+        :param comparisons: list of Comparisons returned by ResultStore.compare()
+        :param fs: file-like object (Optional)
+        """
+        _line_break = '{0:-<130}\n'.format('')
+        log = StringIO.StringIO()
+        fmt = "{0: <20} {1: <35} {2: <14} {3: <14} {4: <10} {5: <10} {6: <10}\n"
+        log.write(fmt.format('Group', 'Function Name', 'Baseline', 'Candidate', 'Change', 'p-value', 'Status'))
+        log.write(_line_break)
+        for c in comparisons:
+            change = 'n/a' if c.change is None else '{:+.1f}%'.format(100 * c.change)
+            log.write(fmt.format(str(c.group), c.function, convert_time_units(c.baseline_median),
+                                 convert_time_units(c.candidate_median), change,
+                                 '{:.3g}'.format(c.p_value), c.status))
+        log.write(_line_break)
+
+        if isinstance(fs, str):
+            with open(fs, 'w') as f:
+                f.write(log.getvalue())
+
+        elif fs is None:
+            print(log.getvalue())
+        else:
+            try:
+                fs.write(log.getvalue())
+            except AttributeError as e:
+                print(e)
@@ -0,0 +1,193 @@
+__author__ = 'calvin'
+
+import fnmatch
+import logging
+import os
+import sys
+import timeit
+import traceback
+
+from .benchmark import Benchmark
+from .benchmarkedclass import BenchmarkedClass
+from .comparisonbenchmark import ComparisonBenchmark
+from .exceptions import ValidationError
+from .reports import exporters
+from .sweepbenchmark import SweepBenchmark
+
+try:
+    from importlib.util import spec_from_file_location, module_from_spec
+except ImportError:
+    import imp  # Python 2.x
+    spec_from_file_location = None
+
+
+def discover_modules(paths, patterns=('bench*.py',)):
+    """
+    Find the benchmark modules in directory trees. Hidden directories and __pycache__ are skipped.
+    :param paths: directories to search and / or paths of modules
+    :param patterns: glob patterns that the file names of benchmark modules match
+    :return: sorted list of module paths
+    """
+    modules = set()
+    for path in paths:
+        if os.path.isfile(path):
+            modules.add(os.path.abspath(path))
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = [d for d in dirs if not d.startswith('.') and d != '__pycache__']
+            for f in files:
+                if f.endswith('.py') and any(fnmatch.fnmatch(f, p) for p in patterns):
+                    modules.add(os.path.abspath(os.path.join(root, f)))
+    return sorted(modules)
+
+
+def load_module(path):
+    """ Import a module from its path. Its directory is added to sys.path so that it can import its neighbours. """
+    directory, filename = os.path.split(path)
+    name = os.path.splitext(filename)[0]
+    if name in sys.modules:
+        # Modules with the same name in different directories
+        name = '_pyperform_{}_{}'.format(len(sys.modules), name)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    if spec_from_file_location is None:
+        return imp.load_source(name, path)
+    spec = spec_from_file_location(name, path)
+    module = module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class BenchmarkUnit(object):
+    """
+    A set of benchmarks that is selected and run together: a comparison group, or the benchmarks of a benchmarked
+    function or class that do not belong to a group.
+    """
+
+    def __init__(self, name, group=None):
+        self.name = name
+        self.group = group
+        self.entries = []
+        self.benchmarks = []
+
+    @property
+    def tags(self):
+        return frozenset(tag for b in self.benchmarks for tag in b.tags)
+
+    def add(self, entry, benchmark):
+        if entry not in self.entries:
+            self.entries.append(entry)
+        self.benchmarks.append(benchmark)
+
+    def matches(self, names=None, tags=None, skip_tags=None):
+        """
+        :param names: glob patterns (or substrings) of the unit name or of the name of one of its benchmarks
+        :param tags: run the unit if one of its benchmarks has one of these tags
+        :param skip_tags: do not run the unit if one of its benchmarks has one of these tags
+        """
+        unit_tags = self.tags
+        if skip_tags and unit_tags.intersection(skip_tags):
+            return False
+        if tags and not unit_tags.intersection(tags):
+            return False
+        if names:
+            candidates = [self.name] + [b.full_name for b in self.benchmarks]
+            patterns = [n if any(c in n for c in '*?[') else '*{}*'.format(n) for n in names]
+            return any(fnmatch.fnmatchcase(c, p) for c in candidates for p in patterns)
+        return True
+
+    def run(self):
+        for entry in self.entries:
+            if self.group is not None:
+                entry.run(group=self.group)
+            elif isinstance(entry, BenchmarkedClass):
+                entry.run_members(self.benchmarks)
+            else:
+                entry.run()
+
+
+def collect_units():
+    """ Group the benchmarks in the registry into BenchmarkUnits, in the order they were registered. """
+    units = []
+    by_key = {}
+    for entry in Benchmark.registry:
+        for b in entry.members():
+            if b.group is not None:
+                key = name = b.group
+            elif isinstance(entry, BenchmarkedClass):
+                key, name = entry, entry.callable.__name__
+            else:
+                key = name = b.full_name
+            if key not in by_key:
+                by_key[key] = BenchmarkUnit(name, b.group)
+                units.append(by_key[key])
+            by_key[key].add(entry, b)
+    return units
+
+
+def list_units(units, fs=None):
+    """ Write the name, size and tags of each unit. """
+    fs = fs or sys.stdout
+    for unit in units:
+        kind = 'group' if unit.group is not None else 'benchmark'
+        tags = ', '.join(sorted(unit.tags))
+        fs.write('{: <40} {: <10} {: >3} function(s)  {}\n'.format(unit.name, kind, len(unit.benchmarks),
+                                                                    '[{}]'.format(tags) if tags else ''))
+
+
+def write_text(unit, fs, include_source=False):
+    if unit.group is None:
+        return
+    if isinstance(unit.benchmarks[0], SweepBenchmark):
+        SweepBenchmark.summarize_sweep(unit.group, fs=fs)
+    else:
+        ComparisonBenchmark.summarize(unit.group, fs=fs, include_source=include_source)
+
+
+def run_units(units, time_budget=None, format='text', output=None, include_source=False):
+    """
+    Run units of benchmarks one after another and write their results as each unit finishes.
+    :param time_budget: total time in seconds. Once it is spent, the remaining units are skipped (a unit that has
+                        started is not interrupted).
+    :param format: 'text' for the summary tables, or the name of an exporter in pyperform.reports.exporters
+    :param output: path of the output file. Defaults to standard out. If an exporter writes to standard out, the
+                   progress that the benchmarks print is sent to standard error so that it does not corrupt the report.
+    :return: tuple of (list of units that failed, list of units that were skipped)
+    """
+    fs = open(output, 'w') if output and format == 'text' else None
+    exporter = exporters[format](output) if format != 'text' else None
+    # The exporter has kept a reference to the real standard out
+    progress = sys.stderr if exporter is not None and not output else None
+    failed, skipped = [], []
+    t_start = timeit.default_timer()
+    try:
+        for unit in units:
+            if time_budget is not None and timeit.default_timer() - t_start >= time_budget:
+                skipped.append(unit)
+                continue
+            stdout = sys.stdout
+            if progress is not None:
+                sys.stdout = progress
+            try:
+                unit.run()
+            except ValidationError as e:
+                logging.error('PyPerform: Validation of {} failed: {}'.format(unit.name, e))
+                failed.append(unit)
+                continue
+            except Exception:
+                logging.error('PyPerform: Error while running {}:\n{}'.format(unit.name, traceback.format_exc()))
+                failed.append(unit)
+                continue
+            finally:
+                sys.stdout = stdout
+            if exporter is not None:
+                exporter.write_group(unit.name, unit.benchmarks)
+            else:
+                write_text(unit, fs, include_source)
+    finally:
+        if exporter is not None:
+            exporter.close()
+        if fs is not None:
+            fs.close()
+    return failed, skipped
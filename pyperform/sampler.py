@@ -0,0 +1,142 @@
+from __future__ import absolute_import
+
+__author__ = 'calvin'
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from timeit import default_timer
+
+BaseThread = threading.Thread      # Store the Thread class from the threading module before monkey-patching
+
+try:
+    from threading import get_ident
+except ImportError:
+    from thread import get_ident  # Python 2.x
+
+
+class _Sampler(object):
+    """
+    A background thread that samples the stacks of every thread registered with a SamplingProfiler, using
+    sys._current_frames(). There is one sampler per process and sampling interval.
+    """
+    samplers = {}
+    _samplers_lock = threading.Lock()
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.pid = os.getpid()
+        self.profilers = {}
+        # Time of the last sample of each profiled thread
+        self._last_sample = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @classmethod
+    def get(cls, interval):
+        with cls._samplers_lock:
+            sampler = cls.samplers.get(interval)
+            # A sampler copied into a forked child process has no running thread, so create a new one.
+            if sampler is None or sampler.pid != os.getpid():
+                sampler = cls.samplers[interval] = cls(interval)
+            return sampler
+
+    def register(self, ident, profiler):
+        with self._lock:
+            self.profilers[ident] = profiler
+            self._last_sample[ident] = default_timer()
+            if self._thread is None:
+                self._thread = BaseThread(target=self._run, name='SamplingProfiler')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def unregister(self, ident):
+        with self._lock:
+            self.profilers.pop(ident, None)
+            self._last_sample.pop(ident, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            # Samples are added under the lock, so a profiler's samples do not change once it has been unregistered
+            with self._lock:
+                if not self.profilers:
+                    self._thread = None
+                    return
+                frames = sys._current_frames()
+                now = default_timer()
+                for ident, profiler in self.profilers.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        # The sampler thread can wake up much later than the interval when it waits for the GIL,
+                        # so each sample is weighted by the time that has actually elapsed since the last one.
+                        profiler.add_sample(frame, now - self._last_sample[ident])
+                    self._last_sample[ident] = now
+                del frames
+
+
+class SamplingProfiler(object):
+    """
+    A statistical profiler that can be used in place of cProfile.Profile. The stack of the profiled thread is sampled
+    every `interval` seconds instead of tracing every call, so the overhead on the profiled thread is small and does
+    not depend on the number of calls it makes. create_stats() builds a pstats-compatible dictionary, so the profiler
+    can be passed to pstats.Stats() and dumped to .stats files.
+
+    Times are estimated from the time elapsed between the samples that a function appeared in, and call counts are the
+    number of samples a function appeared in.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        # Seconds covered by the samples of each stack
+        self.sample_times = Counter()
+        self.stats = {}
+
+    def runcall(self, func, *args, **kwargs):
+        ident = get_ident()
+        sampler = _Sampler.get(self.interval)
+        sampler.register(ident, self)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sampler.unregister(ident)
+
+    def add_sample(self, frame, elapsed=None):
+        """
+        Record the stack of a frame, from the function called by runcall() to the frame itself.
+        :param elapsed: seconds since the previous sample. Defaults to the sampling interval.
+        """
+        stack = []
+        runcall_code = SamplingProfiler.runcall.__code__
+        while frame is not None and frame.f_code is not runcall_code:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        if frame is None:
+            # The thread has not entered (or has already left) runcall()
+            return
+        if not stack:
+            # The thread is inside runcall() itself, before or after calling the function
+            return
+        stack.reverse()
+        stack = tuple(stack)
+        self.samples[stack] += 1
+        self.sample_times[stack] += self.interval if elapsed is None else elapsed
+
+    def create_stats(self):
+        """ Build the pstats dictionary {func: (ncalls, nonrecursive calls, own time, cummulative time, callers)} """
+        stats = {}
+        for stack, count in self.samples.items():
+            t = self.sample_times[stack]
+            leaf = stack[-1]
+            for func in set(stack):
+                cc, nc, tt, ct, callers = stats.get(func, (0, 0, 0., 0., {}))
+                stats[func] = (cc + count, nc + count, tt + (t if func == leaf else 0.), ct + t, callers)
+            for caller, callee in set(zip(stack, stack[1:])):
+                callers = stats[callee][4]
+                cc, nc, tt, ct = callers.get(caller, (0, 0, 0., 0.))
+                callers[caller] = (cc + count, nc + count, tt + (t if callee == leaf else 0.), ct + t)
+        self.stats = stats
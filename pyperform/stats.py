@@ -0,0 +1,166 @@
+__author__ = 'calvin'
+
+import random
+from collections import Counter
+from math import erfc, sqrt
+
+
+def percentile(sorted_values, q):
+    """
+    Return the q-th percentile of a sorted sequence, interpolating linearly between the closest ranks.
+    :param sorted_values: sorted sequence of numbers
+    :param q: percentile in the range [0, 100]
+    """
+    n = len(sorted_values)
+    if n == 0:
+        return None
+    if n == 1:
+        return sorted_values[0]
+    position = (n - 1) * q / 100.
+    lower = int(position)
+    upper = min(lower + 1, n - 1)
+    fraction = position - lower
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * fraction
+
+
+def median(values):
+    """ Return the median of a sequence of numbers. """
+    return percentile(sorted(values), 50)
+
+
+def iqr(values):
+    """ Return the interquartile range of a sequence of numbers. """
+    sorted_values = sorted(values)
+    if not sorted_values:
+        return None
+    return percentile(sorted_values, 75) - percentile(sorted_values, 25)
+
+
+def tukey_fences(values, k=1.5):
+    """
+    Return the (lower, upper) Tukey fences of a sequence of numbers: values more than k interquartile ranges below the
+    first quartile or above the third quartile are outliers.
+    """
+    sorted_values = sorted(values)
+    if not sorted_values:
+        return None
+    q1, q3 = percentile(sorted_values, 25), percentile(sorted_values, 75)
+    return q1 - k * (q3 - q1), q3 + k * (q3 - q1)
+
+
+def remove_outliers(values, k=1.5, min_values=4):
+    """
+    Return the values of a sequence that lie within its Tukey fences, in their original order. Sequences of less than
+    `min_values` numbers are returned unchanged, since their quartiles are too uncertain to identify outliers.
+    """
+    if len(values) < min_values:
+        return list(values)
+    lower, upper = tukey_fences(values, k)
+    return [v for v in values if lower <= v <= upper]
+
+
+def stdev(values):
+    """ Return the sample standard deviation of a sequence of numbers, or None if there are less than two. """
+    n = len(values)
+    if n < 2:
+        return None
+    mean = sum(values) / float(n)
+    return sqrt(sum((v - mean) ** 2 for v in values) / (n - 1))
+
+
+def bootstrap_ci(values, estimator=median, confidence=0.95, n_resamples=1000, seed=0):
+    """
+    Estimate a confidence interval of `estimator` by bootstrap resampling.
+    :param values: sequence of numbers
+    :param estimator: function that reduces a sequence of numbers to a single value
+    :param confidence: confidence level of the interval
+    :param n_resamples: number of bootstrap resamples
+    :param seed: seed of the random number generator, so that intervals are reproducible.
+    :return: tuple of (lower, upper)
+    """
+    n = len(values)
+    if n == 0:
+        return None
+    if n == 1:
+        return values[0], values[0]
+    rng = random.Random(seed)
+    estimates = sorted(estimator([values[rng.randrange(n)] for _ in range(n)]) for _ in range(n_resamples))
+    alpha = (1 - confidence) / 2.
+    return percentile(estimates, 100 * alpha), percentile(estimates, 100 * (1 - alpha))
+
+
+def _rank(values):
+    """ Return the ranks of values (starting at 1), giving tied values the average of their ranks. """
+    order = sorted(range(len(values)), key=values.__getitem__)
+    ranks = [0.] * len(values)
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[order[k]] = (i + j) / 2. + 1
+        i = j + 1
+    return ranks
+
+
+def mann_whitney_min_p(m, n):
+    """
+    Return the smallest two-sided p-value that the Mann-Whitney U test can give for samples of sizes m and n, reached
+    when the samples do not overlap. If it is not below the significance level, the test can not detect any change.
+    """
+    if m == 0 or n == 0:
+        return 1.
+    orderings = 1
+    for k in range(1, m + 1):
+        # Binomial coefficient (m + n choose m)
+        orderings = orderings * (n + k) // k
+    return min(2. / orderings, 1.)
+
+
+_u_distributions = {}
+
+
+def _u_distribution(m, n):
+    """ Return the number of orderings of two samples of sizes m and n that give each value of the U statistic. """
+    key = (m, n)
+    if key not in _u_distributions:
+        if m == 0 or n == 0:
+            counts = [1]
+        else:
+            shifted = [0] * n + _u_distribution(m - 1, n)
+            other = _u_distribution(m, n - 1)
+            counts = [a + (other[u] if u < len(other) else 0) for u, a in enumerate(shifted)]
+        _u_distributions[key] = counts
+    return _u_distributions[key]
+
+
+def mann_whitney_u(a, b):
+    """
+    Two-sided Mann-Whitney U test of whether samples a and b come from the same distribution. The exact distribution
+    of U is used for small samples without ties, otherwise the normal approximation with tie correction is used.
+    :return: tuple of (U, p-value)
+    """
+    m, n = len(a), len(b)
+    if m == 0 or n == 0:
+        return None, 1.
+    values = list(a) + list(b)
+    ranks = _rank(values)
+    u1 = sum(ranks[:m]) - m * (m + 1) / 2.
+    u = min(u1, m * n - u1)
+    ties = len(set(values)) != len(values)
+
+    if not ties and m * n <= 400:
+        counts = _u_distribution(m, n)
+        p = 2. * sum(counts[:int(u) + 1]) / sum(counts)
+        return u, min(p, 1.)
+
+    total = m + n
+    tie_term = 0.
+    for t in Counter(values).values():
+        tie_term += t ** 3 - t
+    variance = m * n / 12. * ((total + 1) - tie_term / (total * (total - 1)))
+    if variance <= 0:
+        return u, 1.
+    z = (u - m * n / 2. + 0.5) / sqrt(variance)
+    return u, min(erfc(-z / sqrt(2)), 1.)
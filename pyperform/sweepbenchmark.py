@@ -0,0 +1,122 @@
+__author__ = 'calvin'
+
+import sys
+from itertools import combinations
+
+from pyperform import StringIO
+from .comparisonbenchmark import ComparisonBenchmark
+from .complexity import fit_complexity, crossovers
+from .tools import convert_time_units, generate_async_statement, generate_direct_call_statement
+
+
+class SweepBenchmark(ComparisonBenchmark):
+    """
+    A ComparisonBenchmark that is run over a range of input sizes. The timings of each function are fitted to common
+    complexity classes and the sizes at which one function of the group overtakes another are reported by
+    SweepBenchmark.summarize_sweep().
+
+    Usage:
+
+        @SweepBenchmark('sort', sizes=[10, 100, 1000, 10000], inputs=lambda n: (list(range(n, 0, -1)),))
+        def builtin_sort(l):
+            return sorted(l)
+
+    :param sizes: iterable of input sizes (Optional if inputs is an iterable)
+    :param inputs: callable that takes an input size and returns the tuple of arguments to call the function with, or
+                   an iterable of (size, arguments) pairs. If not given, the function is called with the size itself.
+    """
+    result_attributes = ComparisonBenchmark.result_attributes + ('sweep', 'complexity')
+
+    def __init__(self, group, sizes=None, inputs=None, classname=None, setup=None, **kw):
+        super(SweepBenchmark, self).__init__(group, classname=classname, setup=setup, **kw)
+        if sizes is None and (inputs is None or callable(inputs)):
+            raise ValueError('sizes is required unless inputs is an iterable of (size, arguments) pairs')
+        if self.isolated:
+            raise ValueError('SweepBenchmarks can not be isolated, their inputs are passed to the statement by reference')
+        if inputs is None:
+            self.inputs = [(n, (n,)) for n in sizes]
+        elif callable(inputs):
+            self.inputs = [(n, tuple(inputs(n))) for n in sizes]
+        else:
+            self.inputs = [(n, tuple(args)) for n, args in inputs]
+        # List of (size, median time) pairs
+        self.sweep = []
+        self.complexity = None
+
+    def call_statement(self, args, kwargs, concurrency=None):
+        """
+        Return the statement that calls the benchmarked function. The inputs are passed by reference through the
+        namespace of the benchmark, as they are in direct mode, so that the timed statement does not rebuild them from
+        their repr() on every loop.
+        """
+        if self.direct or sys.version_info < (3, 5):
+            # timeit only accepts a namespace on Python 3.5+
+            return super(SweepBenchmark, self).call_statement(args, kwargs, concurrency)
+        stmt, namespace = generate_direct_call_statement(self.callable, self.is_class_method, args, kwargs,
+                                                         self.argument_prefix)
+        # The function itself is defined by the setup source
+        namespace.pop(self.callable.__name__, None)
+        self.namespace.update(namespace)
+        if self.is_coroutine:
+            stmt = generate_async_statement(stmt, concurrency)
+        return stmt
+
+    def run_timeit(self, stmt, setup, namespace=None):
+        """
+        Run timeit for each input size. The results of the largest size are kept in the benchmark's time attributes.
+        """
+        self.sweep = []
+        time_avg = None
+        for n, args in self.inputs:
+            self.stmt = self.call_statement(args, self._kwargs, self.concurrency)
+            self.validation_stmt = self.call_statement(args, self._kwargs)
+            if namespace is not None:
+                # The arguments of this size were added to the namespace of the benchmark
+                namespace.update(self.namespace)
+            time_avg = super(SweepBenchmark, self).run_timeit(self.stmt, setup, namespace)
+            self.sweep.append((n, self.time_median_seconds))
+        self.complexity = fit_complexity([n for n, t in self.sweep], [t for n, t in self.sweep])
+        return time_avg
+
+    @staticmethod
+    def summarize_sweep(group, fs=None):
+        """
+        Tabulate the timings of a SweepBenchmark group for each input size, along with the fitted complexity of each
+        function and the sizes at which one function overtakes another.
+        :param str group: name of the comparison group.
+        :param fs: file-like object (Optional)
+        """
+        tests = ComparisonBenchmark.groups[group]
+        sizes = [n for n, args in tests[0].inputs]
+        _line_break = '{0:-<{1}}\n'.format('', 50 + 13 * len(sizes))
+        log = StringIO.StringIO()
+        fmt = '{0: <35} {1: <13}' + ''.join(' {%d: <12}' % (i + 2) for i in range(len(sizes))) + '\n'
+        log.write(fmt.format('Function Name', 'Complexity', *('n={}'.format(n) for n in sizes)))
+        log.write(_line_break)
+        for t in tests:
+            times = dict(t.sweep)
+            log.write(fmt.format(t.full_name, t.complexity.name if t.complexity else 'n/a',
+                                 *(convert_time_units(times[n]) if n in times else 'n/a' for n in sizes)))
+        log.write(_line_break)
+
+        log.write('\nCrossover points:\n\n')
+        n_points = 0
+        for a, b in combinations(tests, 2):
+            for n, faster in crossovers(a.sweep, b.sweep):
+                winner, loser = (a, b) if faster == 0 else (b, a)
+                log.write('\t{} overtakes {} at n = {:.0f}\n'.format(winner.full_name, loser.full_name, n))
+                n_points += 1
+        if not n_points:
+            log.write('\tNone\n')
+
+        if isinstance(fs, str):
+            with open(fs, 'w') as f:
+                f.write(log.getvalue())
+
+        elif fs is None:
+            print(log.getvalue())
+        else:
+            try:
+                fs.write(log.getvalue())
+            except AttributeError as e:
+                print(e)
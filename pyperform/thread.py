@@ -1,5 +1,6 @@
 __author__ = 'calvin'
 
+import atexit
 import cProfile
 import logging
 from pyperform import StringIO
@@ -8,6 +9,16 @@ import pstats
 import sys
 import threading
 import multiprocessing
+import time
+import marshal
+
+try:
+    from multiprocessing.connection import wait
+except ImportError:
+    wait = None  # Python 2.x
+
+from .profilemerge import add_stats, find_stats_files, merge_profiles, write_report, write_stats
+from .sampler import SamplingProfiler
 
 Thread = threading.Thread          # Start off using threading.Thread until changed
 Process = multiprocessing.Process
@@ -19,10 +30,15 @@ profiled_thread_enabled = False
 logged_thread_enabled = True
 
 
-def enable_thread_profiling(profile_dir, exception_callback=None):
+def enable_thread_profiling(profile_dir, exception_callback=None, sampling_interval=None, aggregate=False):
     """
     Monkey-patch the threading.Thread class with our own ProfiledThread. Any subsequent imports of threading.Thread
     will reference ProfiledThread instead.
+    :param sampling_interval: if given, threads are profiled by sampling their stacks every `sampling_interval`
+                              seconds instead of with cProfile, which has a much lower overhead.
+    :param aggregate: if True, profiles are not written per thread. Finished threads add their stats to the
+                      ProfileCollector (child processes send theirs to the parent over a pipe), which writes a single
+                      merged profile on demand with ProfileCollector.write() and at shutdown.
     """
     global profiled_thread_enabled, Thread, Process
     if os.path.isdir(profile_dir):
@@ -30,6 +46,10 @@ def enable_thread_profiling(profile_dir, exception_callback=None):
     else:
         raise OSError('%s does not exist' % profile_dir)
     _Profiler.exception_callback = exception_callback
+    _Profiler.sampling_interval = sampling_interval
+    _Profiler.aggregate = aggregate
+    if aggregate:
+        ProfileCollector.enable()
     Thread = threading.Thread = ProfiledThread
     Process = multiprocessing.Process = ProfiledProcess
     profiled_thread_enabled = True
@@ -53,10 +73,15 @@ class _Profiler(object):
     """
     profile_dir = None
     exception_callback = None
+    sampling_interval = None
+    aggregate = False
     _type = '_Profiler'
 
     def run(self):
-        profiler = cProfile.Profile()
+        if self.sampling_interval:
+            profiler = SamplingProfiler(self.sampling_interval)
+        else:
+            profiler = cProfile.Profile()
         try:
             logging.debug('{cls}: Starting {cls}: {name}'.format(cls=self._type, name=self.name))
             profiler.runcall(super(_Profiler, self).run)
@@ -68,15 +93,29 @@ class _Profiler(object):
                 e_type, e_value, last_traceback = sys.exc_info()
                 self.exception_callback(e_type, e_value, last_traceback)
         finally:
+            if self.aggregate:
+                profiler.create_stats()
+                self.collect_stats(profiler.stats)
+                return
             if self.profile_dir is None:
                 logging.warning('{cls}: profile_dir is not specified. '
                                 'Profile \'{name}\' will not be saved.'.format(cls=self._type, name=self.name))
                 return
             self.print_stats(profiler)
 
+    def collect_stats(self, stats):
+        """ Add the raw stats of the profile to the ProfileCollector. """
+        ProfileCollector.add(stats)
+
     def print_stats(self, profiler):
         name = (self._type + '-' + self.name) if self._type else self.name
         filename = os.path.join(self.profile_dir, name)
+        if isinstance(profiler, SamplingProfiler):
+            profiler.create_stats()
+            if not profiler.stats:
+                # pstats can not load an empty profile
+                logging.debug('{cls}: No samples were taken of {name}'.format(cls=self._type, name=name))
+                return
         logging.debug('Printing stats for {name}'.format(name=name))
         s = StringIO.StringIO()
         sortby = 'cumulative'
@@ -97,21 +136,33 @@ class _Profiler(object):
             f.write(s.getvalue())
 
     @staticmethod
-    def combine_profiles(profile_dir, outfile, sortby='cumulative'):
-        s = StringIO.StringIO()
-        stat_files = [f for f in os.listdir(profile_dir) if os.path.isfile(os.path.join(profile_dir, f))
-                      and f.endswith('.stats')]
-        ps = pstats.Stats(os.path.join(profile_dir, stat_files[0]), stream=s)
-        if len(stat_files) > 1:
-            for stat in stat_files[1:]:
-                ps.add(os.path.join(profile_dir, stat))
-
-        profile_name = os.path.join(profile_dir, '{}.profile'.format(outfile.replace('.profile', '')))
-        with open(profile_name, 'w') as f:
-            ps.strip_dirs()
-            ps.sort_stats(sortby)
-            ps.print_stats()
-            f.write(s.getvalue())
+    def combine_profiles(profile_dir, outfile, sortby='cumulative', pattern=None, processes=1, report=True,
+                         binary=False):
+        """
+        Combine the .stats files in profile_dir into a single profile.
+        :param profile_dir: directory of .stats files
+        :param outfile: name of the combined profile (without extension)
+        :param sortby: sort order of the text report
+        :param pattern: only combine profiles whose name matches this glob pattern, for example 'Thread-Worker*'
+        :param processes: number of processes used to merge the profiles with a tree reduction
+        :param report: write a readable <outfile>.profile text report
+        :param binary: write the combined profile to a binary <outfile>.stats file
+        :raises ValueError: if no .stats files match the pattern
+        """
+        outfile = outfile.replace('.profile', '')
+        stat_files = find_stats_files(profile_dir, pattern, exclude=(outfile + '.stats',))
+        if not stat_files:
+            raise ValueError('No .stats files in {} match the pattern {!r}'.format(profile_dir, pattern))
+        stats = merge_profiles(stat_files, processes=processes)
+        if not stats:
+            logging.warning('_Profiler: The .stats files in {} are empty, no profile was written.'.format(profile_dir))
+            return
+
+        if binary:
+            write_stats(stats, os.path.join(profile_dir, '{}.stats'.format(outfile)))
+
+        if report:
+            write_report(stats, os.path.join(profile_dir, '{}.profile'.format(outfile)), sortby)
 
 
 class ProfiledThread(_Profiler, BaseThread):
@@ -130,6 +181,146 @@ class ProfiledProcess(_Profiler, Process):
     def __init__(self, *args, **kwargs):
         super(ProfiledProcess, self).__init__(*args, **kwargs)
         ProfiledProcess.n_processes += 1
+        self._stats_connection = None
+        if self.aggregate:
+            receiver, self._stats_connection = multiprocessing.Pipe(duplex=False)
+            ProfileCollector.add_connection(receiver)
+
+    def start(self):
+        super(ProfiledProcess, self).start()
+        if self._stats_connection is not None:
+            # Only the child process sends stats. Closing our end lets the collector see when the child is done.
+            self._stats_connection.close()
+
+    def run(self):
+        if self.aggregate:
+            # Stats that were copied from the parent process when it forked are collected by the parent
+            ProfileCollector.reset()
+        super(ProfiledProcess, self).run()
+
+    def collect_stats(self, stats):
+        """
+        Send the raw stats of the profile, merged with the stats collected from the threads and processes that this
+        process started, to the ProfileCollector of the parent process.
+        """
+        ProfileCollector.add(stats)
+        self._stats_connection.send(ProfileCollector.take())
+        self._stats_connection.close()
+
+
+class ProfileCollector(object):
+    """
+    Collects the raw stats of finished profiled threads in memory, along with the stats that child processes send
+    over pipes, and merges them into a single profile. The merged profile is written with ProfileCollector.write(),
+    which is also called at shutdown.
+    """
+    stats = {}
+    outfile = 'aggregate'
+    _lock = threading.Lock()
+    _connections = []
+    _receiver = None
+    _pid = None
+
+    @classmethod
+    def enable(cls, outfile=None):
+        """ Write the merged profile at shutdown. """
+        if outfile is not None:
+            cls.outfile = outfile
+        if cls._pid is None:
+            cls._pid = os.getpid()
+            atexit.register(cls._write_at_exit)
+
+    @classmethod
+    def add(cls, stats):
+        """ Merge the raw stats of a profile. """
+        with cls._lock:
+            add_stats(cls.stats, stats)
+
+    @classmethod
+    def take(cls):
+        """ Return the merged stats, including the stats received so far from child processes, and clear them. """
+        cls.receive_pending()
+        with cls._lock:
+            stats, cls.stats = cls.stats, {}
+        return stats
+
+    @classmethod
+    def reset(cls):
+        """
+        Forget the collected stats and the connections to child processes. Called in a forked child process, where the
+        lock may have been copied while another thread of the parent held it, so the lock is replaced without being
+        acquired.
+        """
+        cls._lock = threading.Lock()
+        cls.stats = {}
+        cls._connections = []
+        cls._receiver = None
+
+    @classmethod
+    def add_connection(cls, connection):
+        """ Receive stats from a child process over a connection. """
+        with cls._lock:
+            cls._connections.append(connection)
+            if cls._receiver is None:
+                cls._receiver = BaseThread(target=cls._receive, name='ProfileCollector')
+                cls._receiver.daemon = True
+                cls._receiver.start()
+
+    @classmethod
+    def _receive(cls):
+        while True:
+            with cls._lock:
+                connections = cls._connections[:]
+                if not connections:
+                    cls._receiver = None
+                    return
+            if wait is not None:
+                wait(connections, timeout=0.1)
+            else:
+                time.sleep(0.1)
+            cls.receive_pending()
+
+    @classmethod
+    def receive_pending(cls):
+        """ Merge the stats that child processes have sent so far. """
+        with cls._lock:
+            for connection in cls._connections[:]:
+                try:
+                    while connection.poll():
+                        add_stats(cls.stats, connection.recv())
+                except (EOFError, OSError):
+                    # The child process has finished
+                    connection.close()
+                    cls._connections.remove(connection)
+
+    @classmethod
+    def write(cls, outfile=None, report=True, binary=True, reset=False, sortby='cumulative'):
+        """
+        Write the merged profile to the profile directory.
+        :param outfile: name of the profile (without extension). Defaults to ProfileCollector.outfile
+        :param report: write a readable <outfile>.profile text report
+        :param binary: write a binary <outfile>.stats file
+        :param reset: clear the collected stats after writing them
+        """
+        cls.receive_pending()
+        with cls._lock:
+            if reset:
+                stats, cls.stats = cls.stats, {}
+            else:
+                # Copy the stats so that they can be written while other threads keep adding to them.
+                stats = marshal.loads(marshal.dumps(cls.stats))
+        if not stats:
+            return
+        filename = os.path.join(_Profiler.profile_dir, outfile or cls.outfile)
+        if binary:
+            write_stats(stats, filename + '.stats')
+        if report:
+            write_report(stats, filename + '.profile', sortby)
+
+    @classmethod
+    def _write_at_exit(cls):
+        if os.getpid() == cls._pid:
+            cls.write()
 
 
 class LoggedThread(BaseThread):
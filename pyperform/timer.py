@@ -1,22 +1,34 @@
 __author__ = 'calvin'
 
+import logging
+import threading
+from functools import wraps
 from time import time
 
-from .tools import convert_time_units
+from .histogram import LatencyHistogram
+from .tools import convert_time_units, iscoroutinefunction, perf_counter_ns
 
 timer_format = "{name}: recent: {recent_time} average: {avg_time}"
 
 
+def report_time(timed_function, func, delta):
+    """ Add the time of a call to the totals of a function wrapped by timer() and print the recent and average time. """
+    timed_function._total_time += delta
+    timed_function._call_count += 1
+    timed_function._average_time = convert_time_units(timed_function._total_time / timed_function._call_count)
+    print(timer_format.format(name=func.__name__, recent_time=convert_time_units(delta), avg_time=timed_function._average_time))
+
+
 def timer(func):
+    if iscoroutinefunction(func):
+        from .asynctools import async_timer
+        return async_timer(func)
+
     def _timed_function(*args, **kwargs):
         t1 = time()
         result = func(*args, **kwargs)
         t2 = time()
-        delta = t2-t1
-        _timed_function._total_time += delta
-        _timed_function._call_count += 1
-        _timed_function._average_time = convert_time_units(_timed_function._total_time / _timed_function._call_count)
-        print(timer_format.format(name=func.__name__, recent_time=convert_time_units(delta), avg_time=_timed_function._average_time))
+        report_time(_timed_function, func, t2-t1)
         return result
 
     _timed_function._total_time = 0
@@ -24,3 +36,98 @@ def timer(func):
     _timed_function.__name__ = "_timed_{}".format(func.__name__)
 
     return _timed_function
+
+
+class LatencyTimer(object):
+    """
+    A low-overhead timer for production code. Each call is timed with perf_counter_ns and recorded into a thread-safe,
+    fixed-memory LatencyHistogram. Nothing is formatted or written on the call path: reports are produced on demand
+    with report() / LatencyTimer.report_all(), or logged every `interval` seconds by a background thread.
+    Percentiles can be queried at any time and the histogram can be snapshot (and reset) without blocking callers.
+
+    Usage:
+
+        @LatencyTimer(interval=60)
+        def handle_request(request):
+            ...
+
+        print(LatencyTimer.report_all())
+        p99 = handle_request.latency_timer.percentile(99)
+
+    """
+    timers = {}
+
+    def __init__(self, name=None, interval=None, logger=None, sub_bucket_bits=5):
+        self.name = name
+        self.interval = interval
+        self.logger = logger or logging.getLogger()
+        self.histogram = LatencyHistogram(sub_bucket_bits)
+        self._reporter = None
+        self._stop_event = threading.Event()
+
+    def __call__(self, func):
+        if self.name is None:
+            self.name = func.__name__
+        LatencyTimer.timers[self.name] = self
+        record = self.histogram.record
+
+        if iscoroutinefunction(func):
+            from .asynctools import async_latency_wrapper
+            _timed_function = async_latency_wrapper(func, record)
+        else:
+            @wraps(func)
+            def _timed_function(*args, **kwargs):
+                t1 = perf_counter_ns()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    record(perf_counter_ns() - t1)
+
+        _timed_function.latency_timer = self
+        if self.interval:
+            self.start_reporting(self.interval)
+        return _timed_function
+
+    def percentile(self, q):
+        """ Return the q-th percentile of the recorded latencies in seconds. """
+        value = self.histogram.percentile(q)
+        return value * 1e-9 if value is not None else None
+
+    def snapshot(self, reset=False):
+        """
+        Return a copy of the latency histogram, which can be merged with the histograms of other threads or processes.
+        :param reset: reset the histogram after taking the snapshot.
+        """
+        return self.histogram.snapshot(reset=reset)
+
+    def report(self):
+        """ Return a text report of the latencies recorded so far. """
+        return self.histogram.report(self.name)
+
+    @staticmethod
+    def report_all():
+        """ Return a text report of the latencies of every LatencyTimer. """
+        return ''.join(t.report() for _, t in sorted(LatencyTimer.timers.items()))
+
+    def start_reporting(self, interval):
+        """
+        Log a report every `interval` seconds from a background thread.
+        :param interval: reporting interval in seconds
+        """
+        self.stop_reporting()
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._reporter = threading.Thread(target=self._report_loop, args=(self._stop_event,),
+                                          name='LatencyTimer-{}'.format(self.name))
+        self._reporter.daemon = True
+        self._reporter.start()
+
+    def stop_reporting(self):
+        """ Stop the background reporting thread. """
+        if self._reporter is not None:
+            self._stop_event.set()
+            self._reporter = None
+
+    def _report_loop(self, stop_event):
+        while not stop_event.wait(self.interval):
+            self.logger.info(self.report())
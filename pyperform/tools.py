@@ -1,17 +1,38 @@
 __author__ = 'calvin'
 
+import atexit
+import logging
+import multiprocessing
+import os
+import platform
 import re
 import sys
-from math import log10
+from math import log10, sqrt
+from timeit import default_timer
 
 if sys.version[0] == '3':
     pass
 else:
     range = xrange
 
+try:
+    from inspect import iscoroutinefunction
+except ImportError:
+    def iscoroutinefunction(func):  # Python 2.x
+        return False
+
+try:
+    from time import perf_counter_ns
+except ImportError:
+    def perf_counter_ns():
+        """ Fallback for Python < 3.7. Return the value of the default timer in integer nanoseconds. """
+        return int(default_timer() * 1e9)
+
 
 classdef_regex = re.compile(r"\S*def .*#!|class .*#!")
 tagged_line_regex = re.compile(r".*#!")
+# Tagged source code of each parsed file, keyed by path: (modification time, source)
+_tagged_imports_cache = {}
 
 
 def convert_time_units(t):
@@ -19,7 +40,7 @@ def convert_time_units(t):
     if t == 0:
         return '0 s'
     order = log10(t)
-    if -9 < order < -6:
+    if order < -6:
         time_units = 'ns'
         factor = 1000000000
     elif -6 <= order < -3:
@@ -34,6 +55,28 @@ def convert_time_units(t):
     return "{:.3f} {}".format(factor * t, time_units)
 
 
+def convert_memory_units(n_bytes):
+    """ Convert a number of bytes into reasonable memory units. """
+    if abs(n_bytes) < 1024:
+        return "{:.0f} B".format(n_bytes)
+    for units in ('KiB', 'MiB', 'GiB'):
+        n_bytes /= 1024.
+        if abs(n_bytes) < 1024 or units == 'GiB':
+            return "{:.1f} {}".format(n_bytes, units)
+
+
+def relative_standard_error(values):
+    """ Return the standard error of the mean of `values` relative to the mean, or None if it cannot be computed. """
+    n = len(values)
+    if n < 2:
+        return None
+    mean = sum(values) / float(n)
+    if mean == 0:
+        return None
+    variance = sum((v - mean) ** 2 for v in values) / (n - 1)
+    return sqrt(variance / n) / mean
+
+
 def globalize_indentation(src):
     """ Strip the indentation level so the code runs in the global scope. """
     lines = src.splitlines()
@@ -65,6 +108,21 @@ def remove_decorators(src):
 
 
 def get_tagged_imports(fp):
+    """
+    Return the source code of the lines in a file that are tagged with #!. Each file is parsed once and the result is
+    cached by path and modification time, so every benchmark in a module shares the same parse.
+    :param fp: path to the source file
+    """
+    mtime = os.path.getmtime(fp)
+    cached = _tagged_imports_cache.get(fp)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    src = _parse_tagged_imports(fp)
+    _tagged_imports_cache[fp] = (mtime, src)
+    return src
+
+
+def _parse_tagged_imports(fp):
     imports = []
     inside_def = False
     def_lines = []
@@ -134,6 +192,98 @@ def generate_call_statement(func, is_class_method, *args, **kwargs):
     return stmt
 
 
+def generate_direct_call_statement(func, is_class_method, args, kwargs, prefix='_pyperform'):
+    """
+    Create a call statement that refers to the function and its arguments by name, so that the real objects can be
+    passed to timeit through its globals instead of being converted to source code with repr().
+    :param prefix: prefix of the names given to the arguments
+    :return: (call statement, namespace of the objects named in the statement)
+    """
+    namespace = {}
+    names = []
+    for i, arg in enumerate(args):
+        name = '{}_arg{}'.format(prefix, i)
+        namespace[name] = arg
+        names.append(name)
+    for kw, val in kwargs.items():
+        name = '{}_kw_{}'.format(prefix, kw)
+        namespace[name] = val
+        names.append('{0}={1}'.format(kw, name))
+    if is_class_method:
+        stmt = 'instance.' + func.__name__
+    else:
+        # Lambdas do not have a name that can be used in a statement
+        stmt = func.__name__ if func.__name__.isidentifier() else '_pyperform_func'
+        namespace[stmt] = func
+    stmt += '(' + ', '.join(names) + ')'
+    return stmt, namespace
+
+
+# Setup code needed by the call statements of coroutine functions. The event loop is fetched in the setup so that its
+# startup cost is not part of the timing.
+async_setup = ('\nfrom pyperform.asynctools import gather as _pyperform_gather\n'
+               'from pyperform.tools import event_loop as _pyperform_event_loop\n'
+               '_pyperform_loop = _pyperform_event_loop()\n')
+_event_loop = (None, None)
+
+
+def event_loop():
+    """
+    Return the event loop that coroutine benchmarks are run in. One loop is created per process and closed at exit.
+    """
+    global _event_loop
+    pid, loop = _event_loop
+    # A loop copied into a forked child process shares its file descriptors with the parent, so create a new one.
+    if loop is None or loop.is_closed() or pid != os.getpid():
+        import asyncio
+        loop = asyncio.new_event_loop()
+        atexit.register(loop.close)
+        _event_loop = os.getpid(), loop
+    return loop
+
+
+def generate_async_statement(stmt, concurrency=None):
+    """
+    Wrap the call statement of a coroutine function so that the coroutine is run to completion in the event loop
+    created by `async_setup`.
+    :param stmt: call statement returned by generate_call_statement()
+    :param concurrency: if given, the statement awaits this many concurrent calls with asyncio.gather()
+    """
+    if concurrency:
+        stmt = '_pyperform_gather([{} for _ in range({})])'.format(stmt, concurrency)
+    return '_pyperform_loop.run_until_complete({})'.format(stmt)
+
+
+def available_cpus():
+    """ Return the list of CPUs that the current process is allowed to run on. """
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(multiprocessing.cpu_count()))
+
+
+def set_cpu_affinity(cpus):
+    """
+    Pin the current process to a set of CPUs.
+    :param cpus: iterable of CPU indices
+    :return: True if the affinity was set, False if it is not supported on this platform.
+    """
+    try:
+        os.sched_setaffinity(0, set(cpus))
+    except AttributeError:
+        logging.warning('PyPerform: Setting the CPU affinity is not supported on this platform.')
+        return False
+    return True
+
+
+def environment():
+    """ Return a dictionary describing the machine and Python interpreter that benchmarks are run on. """
+    return {'machine': '{} ({})'.format(platform.node(), platform.machine()),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'python_version': '{} {}'.format(platform.python_implementation(), platform.python_version())}
+
+
 def walk_tree(start, attr):
     """
     Recursively walk through a tree relationship. This iterates a tree in a top-down approach,